@@ -1,16 +1,26 @@
 import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from time import perf_counter
 from urllib.request import urlretrieve
 from zipfile import ZipFile
 
+from serenata_toolbox import log
+
 from .reimbursements_cleaner import ReimbursementsCleaner
 
 URL = 'https://www.camara.leg.br/cotas/Ano-{}.csv.zip'
 
 
 def extract_zip(zip_path, destination_path):
-    zip_file = ZipFile(zip_path, 'r')
-    zip_file.extractall(destination_path)
-    zip_file.close()
+    """
+    Deprecated: `Reimbursements` reads the CSV straight from the zip file.
+    Kept until the next major version.
+    """
+    warnings.warn('extract_zip is deprecated and will be removed in the next major version',
+                  DeprecationWarning, stacklevel=2)
+    with ZipFile(zip_path, 'r') as zip_file:
+        zip_file.extractall(destination_path)
 
 
 class Reimbursements:
@@ -31,9 +41,76 @@ class Reimbursements:
         return file_path
 
     def fetch(self):
+        """
+        Downloads the zip file only: the cleaner reads the CSV straight from
+        it, so it's never extracted to disk.
+        """
         file_path = os.path.join(self.path, f'Ano-{self.year}.zip')
         urlretrieve(URL.format(self.year), file_path)
-        extract_zip(file_path, self.path)
 
     def clean(self):
         ReimbursementsCleaner(self.year, self.path)()
+
+
+class MultiYearReimbursements:
+    """
+    Get an updated version of the reimbursements dataset for many years at
+    once: all the years are fetched concurrently and each one is cleaned, as
+    soon as it arrives, in a pool of processes (as cleaning is CPU bound), so
+    the whole build takes about as long as the slowest year.
+
+    :param years: (iterable) the years to build
+    :param path: (str) the directory for storing the datasets
+    :param max_workers: (int) processes cleaning the datasets, defaults to
+                        the number of CPUs (and never more than the years)
+    """
+
+    def __init__(self, years, path='data', max_workers=None):
+        self.years = list(dict.fromkeys(str(year) for year in years))
+        if not os.path.isdir(path):
+            os.mkdir(os.path.join(path))
+        self.path = path
+        self.max_workers = min(max_workers or os.cpu_count() or 1, len(self.years) or 1)
+        self.timings = {year: {} for year in self.years}
+
+    def __call__(self):
+        """:return: (list of str) the path of each year's dataset"""
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.years) or 1) as fetchers, \
+                ProcessPoolExecutor(max_workers=self.max_workers) as cleaners:
+            fetching = {fetchers.submit(fetch, year, self.path): year for year in self.years}
+            cleaning = {}
+            for future in as_completed(fetching):
+                year = fetching[future]
+                self.timings[year]['fetch'] = future.result()
+                cleaning[cleaners.submit(clean, year, self.path)] = year
+
+            for future in as_completed(cleaning):
+                self.timings[cleaning[future]]['clean'] = future.result()
+
+        self.log_timings(perf_counter() - start)
+        return [
+            os.path.join(self.path, f'reimbursements-{year}.csv')
+            for year in self.years
+        ]
+
+    def log_timings(self, total):
+        for year in self.years:
+            timing = self.timings[year]
+            log.info(f'{year}: fetched in {timing["fetch"]:.1f}s, '
+                     f'cleaned in {timing["clean"]:.1f}s')
+        log.info(f'Built {len(self.years)} years of reimbursements in {total:.1f}s')
+
+
+def fetch(year, path):
+    """Fetches the given year to `path`, returning how long it took."""
+    start = perf_counter()
+    Reimbursements(year, path).fetch()
+    return perf_counter() - start
+
+
+def clean(year, path):
+    """Cleans the given year in `path`, returning how long it took."""
+    start = perf_counter()
+    Reimbursements(year, path).clean()
+    return perf_counter() - start
@@ -1,9 +1,14 @@
 import csv
 import os.path
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
 
 import numpy as np
 import pandas as pd
 
+from serenata_toolbox import settings
+
 
 COLUMNS = {
     'txNomeParlamentar': 'congressperson_name',
@@ -60,6 +65,7 @@ SUBQUOTAS = (
     ('137', 'Participation in course, talk or similar event'),
     ('999', 'Flight ticket issue')
 )
+SUBQUOTA_DESCRIPTIONS = dict(SUBQUOTAS)
 DTYPE = {
     'txNomeParlamentar': np.str,
     'ideCadastro': np.str,
@@ -101,32 +107,113 @@ AGGREGATED_COLS = {
 class ReimbursementsCleaner:
     """
     Perform data cleaning tasks over a reimbursements CSV file.
+
+    The CSV file is read straight from `Ano-YYYY.zip` (as published by the
+    Chamber of Deputies) if it is in `path`, or from `Ano-YYYY.csv`. With a
+    `chunksize` (defaults to `settings.REIMBURSEMENTS_CHUNK_SIZE`) it is
+    cleaned in a streaming mode, see `stream`.
     """
 
-    def __init__(self, year, path):
+    def __init__(self, year, path, chunksize=None):
         self.year = year
         self.path = path
         self.data = None
+        if chunksize is None:
+            chunksize = settings.REIMBURSEMENTS_CHUNK_SIZE
+        self.chunksize = chunksize
 
     def __call__(self):
+        if self.chunksize:
+            self.stream()
+            return
+
         self.load_source_file()
         self.translate()
         self.aggregate_multiple_payments()
         self.cleanup()
         self.save()
 
+    @property
+    def source_path(self):
+        return os.path.join(self.path, f'Ano-{self.year}.csv')
+
+    @property
+    def zip_path(self):
+        return os.path.join(self.path, f'Ano-{self.year}.zip')
+
+    @property
+    def output_path(self):
+        return os.path.join(self.path, f'reimbursements-{self.year}.csv')
+
+    @contextmanager
+    def open_source_file(self):
+        """
+        Opens the CSV file, decompressing it on the fly (with no extracted
+        copy on disk) if it comes in a zip file.
+        """
+        if not os.path.exists(self.zip_path):
+            with open(self.source_path, 'rb') as fobj:
+                yield fobj
+            return
+
+        with ZipFile(self.zip_path) as archive:
+            with archive.open(_csv_member(archive, self.year)) as fobj:
+                yield fobj
+
     def load_source_file(self):
-        file_path = os.path.join(self.path, f'Ano-{self.year}.csv')
-        self.data = pd.read_csv(file_path,
-                                delimiter=';',
-                                dtype=DTYPE,
-                                low_memory=False)
+        with self.open_source_file() as fobj:
+            self.data = pd.read_csv(fobj,
+                                    delimiter=';',
+                                    dtype=DTYPE,
+                                    low_memory=False)
+
+    def stream(self):
+        """
+        Cleans the CSV file reading `chunksize` rows at a time: the house
+        payments of each chunk are translated, cleaned and written straight to
+        the output file, and only the other payments (the ones whose
+        installments are aggregated by document) are kept, in a buffer that
+        is spilled to disk, partitioned by document id, when it grows over
+        `settings.REIMBURSEMENTS_BUFFER_ROWS` rows. They are aggregated and
+        written at the end, one partition at a time and in the order of the
+        document ids, so the output is the same as the one of the whole file
+        mode.
+        """
+        dtype = dict(DTYPE, **self._inferred_dtypes())
+        with self.open_source_file() as source, TemporaryDirectory() as directory, \
+                open(self.output_path, 'w', newline='') as output:
+            chunks = pd.read_csv(source,
+                                 delimiter=';',
+                                 dtype=dtype,
+                                 chunksize=self.chunksize)
+            installments = InstallmentsBuffer(directory)
+            columns = None
+            for chunk in chunks:
+                self.data = chunk
+                self.translate()
+                installments.add(self.data[self.data['reimbursement_number'] != '0'])
+
+                self.data = self._house_payments()
+                self.cleanup()
+                self.data.to_csv(output, header=columns is None, index=False)
+                columns = list(self.data.columns)
+
+            if columns is None:  # no rows at all
+                self.data = None
+                return
+
+            for self.data in installments.partitions():
+                self.data = self._non_house_payments()
+                self.cleanup()
+                self.data = self.data[columns]
+                self.data.to_csv(output, header=False, index=False)
 
     def translate(self):
-        self.data.rename(columns=COLUMNS, inplace=True)
-        for code, name in SUBQUOTAS:
-            rows = self.data['subquota_number'] == code
-            self.data.loc[rows, 'subquota_description'] = name
+        _rename(self.data, COLUMNS)
+        descriptions = self.data['subquota_number'].map(SUBQUOTA_DESCRIPTIONS)
+        unknown = self.data['subquota_description']  # kept for unknown codes
+        descriptions.fillna(unknown, inplace=True)
+        self.data['subquota_description'] = descriptions.astype('category')
 
     def aggregate_multiple_payments(self):
         self.data = pd.concat([
@@ -146,23 +233,187 @@ class ReimbursementsCleaner:
             self.data.drop(columns=to_drop, inplace=True)
 
     def save(self):
-        file_path = os.path.join(self.path, f'reimbursements-{self.year}.csv')
-        self.data.to_csv(file_path, index=False)
+        self.data.to_csv(self.output_path, index=False)
+
+    def _inferred_dtypes(self):
+        """
+        Dtypes pandas infers for the columns not in `DTYPE` when reading the
+        whole file (e.g. `vlrRestituicao` is int64 unless a value is blank),
+        so every chunk gets the same ones and the output is the same as the
+        one of the whole file mode.
+        """
+        with self.open_source_file() as fobj:
+            data = pd.read_csv(fobj,
+                               delimiter=';',
+                               usecols=lambda column: column not in DTYPE,
+                               low_memory=False)
+        return data.dtypes.to_dict()
 
     def _house_payments(self):
         data = self.data[self.data['reimbursement_number'] == '0'].copy()
-        data.rename(columns=AGGREGATED_COLS, inplace=True)
-        data['numbers'] = data['numbers'].apply(lambda val: [val])
+        _rename(data, AGGREGATED_COLS)
+        numbers = data['numbers'].values.reshape(-1, 1)
+        data['numbers'] = numbers.tolist() if len(numbers) else []
         return data
 
     def _non_house_payments(self):
-        data = self.data[self.data['reimbursement_number'] != '0'].copy()
-        data.rename(columns=AGGREGATED_COLS, inplace=True)
-        attributes = {
-            key: 'first' for key in data.columns
-            if key is not KEY
-        }
-        attributes['numbers'] = list
-        attributes['total_net_value'] = 'sum'
-        attributes['total_value'] = 'sum'
-        return data.groupby(KEY, as_index=False).agg(attributes)
+        """
+        Aggregates the installments of each document in a few vectorized
+        passes (the same output as a `groupby` with `first`, `sum` and `list`
+        aggregations): rows are sorted by document, the boundaries of each
+        group are computed once and every column is reduced by segments.
+        """
+        rows = (self.data['reimbursement_number'] != '0') & self.data[KEY].notnull()
+        data = self.data[rows]
+        data = data.iloc[np.argsort(data[KEY].values, kind='mergesort')]
+        _rename(data, AGGREGATED_COLS)
+
+        keys = data[KEY].values
+        starts = _segments(keys)
+        ends = np.r_[starts[1:], len(keys)]
+        segments = np.repeat(np.arange(len(starts)), ends - starts)  # of each row
+
+        columns = {KEY: keys[starts]}
+        for column in data.columns:
+            if column == KEY:
+                continue
+            if column == 'numbers':
+                numbers = data[column].tolist()
+                columns[column] = [numbers[start:end] for start, end in zip(starts, ends)]
+            elif column in ('total_net_value', 'total_value'):
+                columns[column] = _segment_sum(data[column].values, segments)
+            else:
+                columns[column] = _segment_first(data[column], starts)
+
+        return pd.DataFrame(columns)
+
+
+def _segments(keys):
+    """Positions where each run of equal (sorted) `keys` begins."""
+    if not len(keys):
+        return np.array([], dtype=int)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _segment_sum(values, segments):
+    """
+    Sums `values` by `segments` (the segment of each value), skipping nulls.
+    Pandas' summation is compensated, so values rounded by the
+    floating point arithmetic are the same as `groupby(...).sum()` ones.
+    """
+    return pd.Series(values).groupby(segments, sort=False).sum().values
+
+
+def _segment_first(series, starts):
+    """First non-null value of each segment of `series` beginning at `starts`."""
+    values = series.iloc[starts].reset_index(drop=True)
+    missing = series.isnull().values
+    if not missing[starts].any():
+        return values
+
+    positions = np.where(missing, len(series), np.arange(len(series)))
+    first = np.minimum.reduceat(positions, starts)
+    ends = np.r_[starts[1:], len(series)]
+    found = first < ends
+    values = series.iloc[np.where(found, first, starts)].reset_index(drop=True)
+    return values.where(found)
+
+
+class InstallmentsBuffer:
+    """
+    Keeps the rows added to it in memory until they are more than `max_rows`,
+    then pickles them (keeping their dtypes) to files in `directory`, one per
+    range of document ids (`PARTITIONS` ranges, taken from the ids of the
+    first rows spilled). As all the installments of a document are in the
+    same partition, and partitions are in the order of their ids, they can be
+    aggregated one partition at a time (see `partitions`).
+
+    :param directory: (str) where spilled rows are saved
+    :param max_rows: (int) defaults to `settings.REIMBURSEMENTS_BUFFER_ROWS`
+    :param depth: (int) how many times these rows have been partitioned
+    """
+
+    PARTITIONS = 16
+    MAX_DEPTH = 4  # partitions too big are split again, up to this depth
+
+    def __init__(self, directory, max_rows=None, depth=0):
+        self.directory = directory
+        if max_rows is None:
+            max_rows = settings.REIMBURSEMENTS_BUFFER_ROWS
+        self.max_rows = max_rows
+        self.depth = depth
+        self.frames = []
+        self.rows = 0
+        self.boundaries = None  # ids where each partition (but the first) begins
+        self.spilled = []  # paths and number of rows of each partition
+
+    def add(self, data):
+        data = data[data[KEY].notnull()]  # not aggregated
+        self.frames.append(data)
+        self.rows += len(data)
+        if self.rows > self.max_rows:
+            self.spill()
+
+    def spill(self):
+        data = pd.concat(self.frames, sort=False)
+        self.frames, self.rows = [], 0
+        keys = data[KEY].values
+
+        if self.boundaries is None:
+            unique = np.unique(keys)
+            positions = np.linspace(0, len(unique), self.PARTITIONS + 1)[1:-1]
+            self.boundaries = np.unique(unique[positions.astype(int)])
+            self.spilled = [([], 0) for _ in range(len(self.boundaries) + 1)]
+
+        partitions = np.searchsorted(self.boundaries, keys, side='right')
+        for partition in np.unique(partitions):
+            rows = data[partitions == partition]
+            paths, count = self.spilled[partition]
+            path = os.path.join(self.directory, f'installments-{partition}-{len(paths)}.pkl')
+            rows.to_pickle(path)
+            self.spilled[partition] = (paths + [path], count + len(rows))
+
+    def partitions(self):
+        """
+        :return: (generator of pandas.DataFrame) all the rows added, each
+                 document's installments in the order they were added, in
+                 partitions sorted by document id (each with up to about
+                 `max_rows` rows, as long as they can be split)
+        """
+        if not self.spilled:
+            if self.frames:
+                yield pd.concat(self.frames, sort=False)
+            return
+
+        if self.frames:
+            self.spill()
+
+        for number, (paths, count) in enumerate(self.spilled):
+            if count > self.max_rows and len(paths) > 1 and self.depth < self.MAX_DEPTH:
+                directory = os.path.join(self.directory, str(number))
+                os.mkdir(directory)
+                split = InstallmentsBuffer(directory, self.max_rows, self.depth + 1)
+                for path in paths:
+                    split.add(pd.read_pickle(path))
+                    os.remove(path)
+                yield from split.partitions()
+            elif paths:
+                yield pd.concat([pd.read_pickle(path) for path in paths], sort=False)
+
+
+def _csv_member(archive, year):
+    """The name of the reimbursements CSV file in a zip `archive`."""
+    names = archive.namelist()
+    expected = f'Ano-{year}.csv'
+    if expected in names:
+        return expected
+
+    csvs = [name for name in names if name.lower().endswith('.csv')]
+    if len(csvs) != 1:
+        raise ValueError(f'Could not find {expected} in {archive.filename}')
+    return csvs[0]
+
+
+def _rename(data, columns):
+    """Renames columns in place, replacing the index of column labels once."""
+    data.columns = [columns.get(column, column) for column in data.columns]
@@ -2,7 +2,16 @@ import os
 
 from serenata_toolbox import log, settings
 from serenata_toolbox.datasets.downloader import Downloader
+from serenata_toolbox.datasets.loader import (
+    CHUNK_SIZE,
+    LazyDataset,
+    chunks,
+    memo,
+    newest,
+    read,
+)
 from serenata_toolbox.datasets.local import LocalDatasets
+from serenata_toolbox.datasets.uploader import Uploader
 
 
 class Datasets:
@@ -24,18 +33,74 @@ class Datasets:
     * `Datasets.downloader` implements a async manager to download files from
       the remote bucket. It's `Datasets.downloader.download(files)` take the
       path for a single file (str) as argument or an iterable of paths (str).
+      From within a running event loop, await
+      `Datasets.downloader.download_async(files)` instead.
+
+    Datasets can also be loaded by name: `Datasets.load('reimbursements')`
+    resolves to the newest local file of that dataset (downloading the
+    newest one listed in `Downloader.LATEST` if there is none) and returns a
+    `LazyDataset`, which is read only when its data is first accessed.
 
     :param local_directory: (str) path to local directory of the datasets
     :param timeout: (float) timeout parameter to Downloader,
            None or 0 disables timeout check.
+
+    Other keyword arguments (e.g. `parts`, `preflight`, `materialize` or
+    `budget`) are passed to the Downloader.
     """
 
-    def __init__(self, local_directory=None, timeout=None):
+    def __init__(self, local_directory=None, timeout=None, **kwargs):
         if not local_directory:
             local_directory = 'data'
 
         self.local = LocalDatasets(local_directory)
-        self.downloader = Downloader(local_directory, timeout=timeout)
+        self.downloader = Downloader(local_directory, timeout=timeout, **kwargs)
+
+    def resolve(self, name):
+        """
+        :param name: (str) a dataset name (e.g. presences or reimbursements)
+        :return: (str) the path to the newest local version of the dataset,
+                 downloaded if there is no local version
+        """
+        filename = newest(name, self.local.all)
+        if not filename:
+            filename = newest(name, self.downloader.LATEST)
+            if not filename:
+                raise FileNotFoundError(f'There is no dataset called {name}')
+            # downloads in a thread with its own event loop, as this can be
+            # called from code running inside another one (e.g. Jupyter)
+            for _ in self.downloader.as_completed(filename):
+                pass
+
+        return os.path.join(self.local.directory, filename)
+
+    def load(self, name, memoize=True, **kwargs):
+        """
+        :param name: (str) a dataset name (e.g. presences or reimbursements)
+        :param memoize: (bool) reuse the frame if the same version of the
+               dataset was already read with the same arguments in this
+               process (see `loader.Memo`)
+        :param kwargs: `columns`, `dtype` and `filters` to read only what is
+               needed (see `loader.read`), others are passed to
+               `pandas.read_csv`
+        :return: (LazyDataset) the newest version of the dataset, resolved
+                 and read only when its data is first accessed
+        """
+        reader = memo.read if memoize else read
+        return LazyDataset(name, lambda: self.resolve(name), reader, **kwargs)
+
+    def chunks(self, name, chunksize=None, **kwargs):
+        """
+        :param name: (str) a dataset name (e.g. presences or reimbursements)
+        :param chunksize: (int) the maximum number of rows in each chunk
+        :param kwargs: `columns`, `dtype` and `filters` (see `loader.read`),
+               others are passed to `pandas.read_csv`
+        :return: (generator of pandas.DataFrame) the newest version of the
+                 dataset in chunks, so it can be processed with bounded
+                 memory (see `loader.chunks`)
+        """
+        path = self.resolve(name)
+        return chunks(path, chunksize or CHUNK_SIZE, **kwargs)
 
 
 # shortcuts & retrocompatibility
@@ -46,6 +111,12 @@ def fetch(filename, destination_path):
 
 
 def fetch_latest_backup(destination_path, force_all=False):
+    """
+    Downloads the latest datasets missing in `destination_path` (or whose
+    local copy is known to be corrupted). With `force_all` every file is
+    requested, but the ones already downloaded are requested conditionally,
+    so the server sends them again only if they have changed.
+    """
     datasets = Datasets(destination_path)
 
     if force_all:
@@ -54,9 +125,20 @@ def fetch_latest_backup(destination_path, force_all=False):
         files = tuple(
             f for f in datasets.downloader.LATEST
             if not os.path.exists(os.path.join(destination_path, f))
+            or not datasets.downloader.manifest.is_intact(f)
         )
 
     if not files:
         log.info('You already have all the latest datasets! Nothing to download.')
 
     return datasets.downloader.download(files)
+
+
+def upload(filename, source_path):
+    """
+    Publishes `filename` (str or iterable of str) from `source_path` to the
+    remote bucket, skipping files whose remote copy is unchanged. Requires
+    `AMAZON_ACCESS_KEY` and `AMAZON_SECRET_KEY` to be set.
+    """
+    uploader = Uploader(source_path)
+    return uploader.upload(filename)
@@ -0,0 +1,125 @@
+import os
+import time
+
+from serenata_toolbox import log, settings
+from serenata_toolbox.datasets.catalog import parse_filename
+from serenata_toolbox.datasets.columnar import EXTENSION, columnar_path
+from serenata_toolbox.datasets.loader import EXTENSIONS, newest_versions
+from serenata_toolbox.datasets.manifest import Manifest
+
+
+class CacheManager:
+    """
+    Keeps the data directory within a budget: once the datasets there take
+    more than `budget` bytes, the least recently used ones are deleted until
+    they fit. Datasets not used for `max_age` days are deleted regardless
+    of the budget. A dataset and its columnar copy count (and go) together.
+
+    The newest version of each dataset and the `pinned` ones are never
+    deleted. Deleted datasets are recorded in the manifest of the directory,
+    so syncs don't download them again.
+
+    :param directory: (str) the directory where the datasets are stored
+    :param budget: (int) the maximum size in bytes, 0 disables this limit
+    :param max_age: (float) in days, 0 disables this limit
+    :param pinned: (iterable of str) dataset names (e.g. reimbursements) or
+           file names to keep
+    :param manifest: (Manifest) the manifest of the directory (e.g. the one
+           of a Downloader), loaded from the directory if not given
+    """
+
+    def __init__(self, directory, budget=None, max_age=None, pinned=None, manifest=None):
+        self.directory = directory
+        self.budget = settings.DATA_BUDGET if budget is None else budget
+        self.max_age = settings.DATA_MAX_AGE if max_age is None else max_age
+        self.pinned = set(settings.DATA_PINNED if pinned is None else pinned)
+        self._manifest = manifest
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = Manifest(self.directory)
+        return self._manifest
+
+    @property
+    def enabled(self):
+        return bool(self.budget or self.max_age)
+
+    def datasets(self):
+        """
+        :return: (dict) for each dataset file, a tuple with its size plus the
+                 size of its columnar copy, and the last time either was used
+        """
+        stats = {}
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(EXTENSIONS + (EXTENSION,)) and item.is_file():
+                    stat = item.stat()
+                    stats[item.name] = stat.st_size, max(stat.st_atime, stat.st_mtime)
+
+        datasets = {}
+        for filename in [f for f in stats if f.endswith(EXTENSIONS)]:
+            size, used = stats[filename]
+            copy = os.path.basename(columnar_path(filename))
+            if copy in stats:
+                size, used = size + stats[copy][0], max(used, stats.pop(copy)[1])
+            datasets[filename] = size, used
+
+        for copy in (f for f in stats if f.endswith(EXTENSION)):
+            datasets[copy] = stats[copy]  # source is gone
+        return datasets
+
+    def usage(self):
+        return sum(size for size, _ in self.datasets().values())
+
+    def protected(self, filenames):
+        latest = set(newest_versions(filenames).values())
+        pinned = {f for f in filenames if self.is_pinned(f)}
+        return latest | pinned
+
+    def is_pinned(self, filename):
+        return filename in self.pinned or parse_filename(filename)[0] in self.pinned
+
+    def evict(self, keep=()):
+        """
+        Deletes datasets (least recently used first) until the directory is
+        within its budget, and the ones older than `max_age`.
+
+        :param keep: (iterable of str) other file names not to delete (e.g.
+               the ones just downloaded)
+        :return: (tuple of str) the file names deleted
+        """
+        if not self.enabled:
+            return ()
+
+        datasets = self.datasets()
+        protected = self.protected(tuple(datasets)) | set(keep)
+        candidates = sorted(
+            (used, filename) for filename, (_, used) in datasets.items()
+            if filename not in protected
+        )
+
+        usage, evicted = sum(size for size, _ in datasets.values()), []
+        oldest = time.time() - self.max_age * 24 * 60 * 60
+        for used, filename in candidates:
+            expired = self.max_age and used < oldest
+            if not expired and (not self.budget or usage <= self.budget):
+                break
+
+            self.delete(filename)
+            usage -= datasets[filename][0]
+            evicted.append(filename)
+
+        if self.budget and usage > self.budget:
+            log.warning(f'{self.directory} takes {usage} bytes, over its budget of '
+                        f'{self.budget} bytes, but the remaining datasets are protected')
+        return tuple(evicted)
+
+    def delete(self, filename):
+        path = os.path.join(self.directory, filename)
+        for path in {path, columnar_path(path)}:
+            if os.path.exists(path):
+                os.remove(path)
+        if filename.endswith(EXTENSIONS):
+            self.manifest.evict(filename)
+        log.info(f'Evicted {filename} from {self.directory}')
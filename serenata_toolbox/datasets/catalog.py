@@ -0,0 +1,162 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from serenata_toolbox import log
+from serenata_toolbox.datasets import manifest
+
+
+FILENAME = '.catalog.json'
+COLUMNAR_EXTENSION = '.feather'  # columnar copies of the datasets, see columnar
+TMP_SUFFIX = '.tmp'  # files being written, renamed once they are complete
+CHUNK_SIZE = 10 ** 5  # rows read at a time when inspecting a dataset
+DATASET_NAME = re.compile(r'^(?:(?P<date>\d{4}-\d{2}-\d{2})-)?(?P<name>.+?)(?:\.csv)?(?:\.xz)?$')
+
+
+def is_bookkeeping(filename):
+    """
+    Files the toolbox keeps next to the datasets (unfinished downloads, files
+    still being written, columnar copies, the manifest and the catalog) which
+    are not datasets themselves.
+    """
+    partial = manifest.PARTIAL_SUFFIX
+    if filename.endswith((partial, partial + manifest.SIDECAR_SUFFIX)):
+        return True  # unfinished download
+    if filename.endswith((TMP_SUFFIX, COLUMNAR_EXTENSION)):
+        return True  # derived from a dataset, or not complete yet
+    return filename in (manifest.FILENAME, FILENAME)
+
+
+def parse_filename(filename):
+    """
+    :param filename: (str) e.g. 2017-05-29-presences.xz
+    :return: (tuple of str) the dataset name and its date stamp (e.g.
+             presences and 2017-05-29), the latter is None if there's none
+    """
+    match = DATASET_NAME.match(filename)
+    return match.group('name'), match.group('date')
+
+
+class Catalog:
+    """
+    Describes the datasets in a directory without opening them: the catalog
+    is kept next to the data and records the size, modification time, dataset
+    name and date stamp of each file plus, for CSV files (compressed or not),
+    their row count, column schema and the range of their date columns.
+    Columnar copies are not listed on their own: their size is recorded in
+    the entry of the dataset they were made from.
+
+    `refresh` updates it in a single `os.scandir` pass, inspecting only the
+    files that are new or whose modification time (or size) has changed.
+
+    :param directory: (str) the directory where the datasets are stored
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, FILENAME)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as fobj:
+                return json.load(fobj)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fobj:
+            json.dump(self.entries, fobj, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def refresh(self):
+        """
+        :return: (dict) the catalog entries, indexed by file name
+        """
+        entries, copies, changed = {}, {}, False
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if not item.is_file():
+                    continue
+                if item.name.endswith(COLUMNAR_EXTENSION):
+                    copies[item.name] = item.stat().st_size
+                if is_bookkeeping(item.name):
+                    continue
+
+                stat = item.stat()
+                entry = self.entries.get(item.name)
+                if not entry or (entry['mtime'], entry['size']) != (stat.st_mtime, stat.st_size):
+                    entry, changed = self.describe(item.path, stat), True
+                entries[item.name] = entry
+
+        for filename, entry in entries.items():
+            size = copies.get(os.path.splitext(filename)[0] + COLUMNAR_EXTENSION)
+            if entry.get('columnar_size') != size:
+                entry['columnar_size'], changed = size, True
+
+        if changed or entries.keys() != self.entries.keys():
+            self.entries = entries
+            self.save()
+        return self.entries
+
+    def describe(self, path, stat):
+        filename = os.path.basename(path)
+        name, date = parse_filename(filename)
+        entry = {
+            'name': name,
+            'date': date,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'columnar_size': None,
+            'rows': None,
+            'columns': None,
+            'date_range': None,
+        }
+
+        if filename.endswith(('.csv', '.xz')):
+            try:
+                entry.update(self.inspect(path))
+            except Exception as error:  # not a CSV after all
+                log.error(f'Could not inspect {path}: {error}')
+
+        return entry
+
+    @staticmethod
+    def inspect(path):
+        """
+        Reads a CSV file in chunks (so memory use is bounded regardless of
+        its size) to count its rows, infer the type of its columns and find
+        the earliest and the latest dates in columns named like a date.
+        """
+        rows, columns, date_range = 0, {}, {}
+        chunks = pd.read_csv(path, encoding='utf-8', low_memory=False, chunksize=CHUNK_SIZE)
+        for chunk in chunks:
+            rows += len(chunk)
+            for column, dtype in chunk.dtypes.items():
+                known = columns.get(column)
+                if known is None or known == str(dtype):
+                    columns[column] = str(dtype)
+                    continue
+                try:
+                    columns[column] = str(np.result_type(known, dtype))
+                except TypeError:
+                    columns[column] = 'object'
+
+            for column in (c for c in chunk.columns if 'date' in c.lower()):
+                dates = pd.to_datetime(chunk[column], errors='coerce').dropna()
+                if dates.empty:
+                    continue
+                start, end = dates.min().isoformat(), dates.max().isoformat()
+                if column in date_range:
+                    start = min(start, date_range[column][0])
+                    end = max(end, date_range[column][1])
+                date_range[column] = [start, end]
+
+        return {'rows': rows, 'columns': columns, 'date_range': date_range}
@@ -0,0 +1,487 @@
+import asyncio
+import json
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+
+import pandas as pd
+
+from serenata_toolbox import log
+from serenata_toolbox.datasets.catalog import COLUMNAR_EXTENSION
+from serenata_toolbox.datasets.dtypes import preset
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import feather
+except ImportError:  # optional, see the columnar extra
+    pa = pc = feather = None
+
+
+EXTENSION = COLUMNAR_EXTENSION
+QUEUE_SIZE = 64  # chunks waiting to be decompressed
+CHUNK_ROWS = 10 ** 5  # rows parsed (and held in memory) at a time when streaming
+SOURCE_KEY = b'serenata:source'  # schema metadata identifying the CSV file
+STRINGS = (str, 'str', object, 'object')
+
+
+def columnar_path(path):
+    """
+    :param path: (str) path to a xz compressed CSV file
+    :return: (str) path to its columnar (Feather) copy
+    """
+    return os.path.splitext(path)[0] + EXTENSION
+
+
+def source_key(path):
+    """
+    :return: (bytes) what identifies the current version of the CSV file in
+             `path` (its modification time and size) and how it is parsed
+             (its dtypes preset), or None if it's missing
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    dtype = sorted((column, str(value)) for column, value in preset(path).items())
+    key = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'dtype': dtype}
+    return json.dumps(key).encode()
+
+
+def read_csv(path, source=None, **kwargs):
+    """
+    Parses the CSV file in `path` (or its contents from `source`, a file-like
+    object) the way its columnar copy does.
+    """
+    source = path if source is None else source
+    return pd.read_csv(source, encoding='utf-8', dtype=preset(path), low_memory=False, **kwargs)
+
+
+def write_columnar(df, path):
+    """
+    Saves `df` as the columnar copy of the CSV file in `path`, recording the
+    version of the CSV file it came from. The copy is not compressed so it
+    can be memory-mapped (and read with no copies, where possible).
+
+    :param df: (pandas.DataFrame) the contents of the CSV file
+    :param path: (str) path to the CSV file
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    key = source_key(path)
+    if key:
+        table = table.replace_schema_metadata({**table.schema.metadata, SOURCE_KEY: key})
+
+    destination = columnar_path(path)
+    tmp = destination + '.tmp'
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, destination)
+    return destination
+
+
+def read_columnar(path, columns=None):
+    """
+    Memory-maps the columnar copy of the CSV file in `path`, as long as it
+    was created from the current version of the CSV file.
+
+    :param path: (str) path to the CSV file
+    :param columns: (list of str) only read these columns, raises a KeyError
+           if any of them is not in the dataset
+    :return: (pyarrow.Table) or None if there's no up to date copy
+    """
+    cached = columnar_path(path)
+    if feather is None or not os.path.exists(cached):
+        return None
+
+    try:  # memory-mapped and uncompressed: columns not selected are not read
+        table = feather.read_table(cached, memory_map=True)
+    except Exception as error:  # e.g. a truncated file, it'll be rebuilt
+        log.error(f'Could not read {cached}: {error}')
+        return None
+
+    metadata = table.schema.metadata or {}
+    if metadata.get(SOURCE_KEY) != source_key(path):
+        return None  # stale: the CSV file changed after the copy was made
+
+    if columns is not None:
+        missing = [column for column in columns if column not in table.column_names]
+        if missing:
+            raise KeyError(f'{missing} not in {path}')
+        table = table.select(list(columns))
+    return table
+
+
+def load(path, columns=None, dtype=None):
+    """
+    Reads the CSV file in `path` through its columnar copy, creating (or
+    refreshing) the copy if needed, so only the first read pays for the
+    decompression and parsing of the CSV.
+
+    :param path: (str) path to the CSV file
+    :param columns: (list of str) only read these columns
+    :param dtype: (dict) dtypes to convert columns to
+    :return: (pandas.DataFrame) or None if the copy can't provide the dtypes
+             requested (e.g. strings for a column stored as numbers) or if
+             pyarrow is not installed (then it's up to the caller to read
+             only what it needs from the CSV file)
+    """
+    if pa is None:
+        return None
+
+    table = read_columnar(path, columns)
+    if table is not None:
+        if not strings_compatible(table, dtype):
+            return None
+        df = table.to_pandas(split_blocks=True)  # avoids consolidation copies
+    else:
+        df = read_csv(path)
+        try:
+            write_columnar(df, path)
+        except Exception as error:
+            log_failure(path, error)
+        if columns is not None:
+            df = df[list(columns)]
+        others = {column for column, value in df.dtypes.items() if value != object}
+        if not compatible(others, dtype):
+            return None
+
+    return cast(df, dtype)
+
+
+def cast(df, dtype):
+    """Converts the columns of `df` read from a columnar copy to `dtype`."""
+    dtype = {  # strings are already objects, astype would turn nulls into text
+        k: v for k, v in (dtype or {}).items()
+        if k in df.columns and str(df[k].dtype) != str(v) and v not in STRINGS
+    }
+    return df.astype(dtype) if dtype else df
+
+
+def strings_compatible(table, dtype):
+    others = {f.name for f in table.schema if not pa.types.is_string(f.type)}
+    return compatible(others, dtype)
+
+
+def compatible(others, dtype):
+    """
+    Strings can't be recovered from columns stored as numbers (e.g. leading
+    zeros are gone), all the other conversions are fine.
+
+    :param others: (set of str) the columns not stored as strings
+    :param dtype: (dict) the dtypes requested
+    """
+    return not any(
+        column in others for column, value in (dtype or {}).items()
+        if value in STRINGS
+    )
+
+
+def convert(path):
+    """
+    Creates the columnar copy of the xz compressed CSV file in `path`, parsing
+    it in chunks (see `ColumnarWriter`). As the copy is optional, errors are
+    logged and `None` is returned.
+    """
+    writer = ColumnarWriter(path)
+    try:
+        if writer.write(path, compression='xz'):
+            return writer.close()
+        writer.discard()  # chunks disagree on their types
+        return write_columnar(read_csv(path, compression='xz'), path)
+    except Exception as error:
+        writer.discard()
+        log_failure(path, error)
+
+
+def log_failure(path, error):
+    log.error(f'Could not convert {path} to a columnar format: {error}')
+
+
+class Aborted(Exception):
+    pass
+
+
+class QueueReader:
+    """
+    A read-only file-like object whose contents are the chunks of bytes put in
+    a queue by another thread, until a `None` is put there. Putting an
+    exception makes `read` raise it.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.buffer = b''
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = self.queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                self.finished = True
+            else:
+                self.buffer += chunk
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class ColumnarWriter:
+    """
+    Writes the columnar copy of the CSV file in `path` from the chunks of
+    `CHUNK_ROWS` rows it is parsed in (see `write`), so only one chunk at a
+    time is held in memory: each chunk is appended to a temporary file as it
+    is parsed. Chunks can get different types (e.g. integers in one, floats
+    in another one with blanks) so `close` rewrites them, memory-mapped, into
+    the copy with the types pandas infers for the whole file (the same
+    `write_columnar` gets).
+
+    :param path: (str) path to the CSV file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.destination = columnar_path(path)
+        self.dtype = preset(path)
+        categories = [column for column, value in self.dtype.items() if value == 'category']
+        self.dtype.update((column, str) for column in categories)  # encoded at the end
+        self.categories = {column: set() for column in categories}
+        self.empty = None  # the first chunk with no rows, for its columns
+        self.types = {}  # of each column, from the chunks with any value
+        self.nulls = set()  # columns with a null in any chunk
+        self.paths = []  # temporary files, one per schema of the chunks
+        self.schema = self.sink = self.writer = None
+
+    def write(self, source, **kwargs):
+        """
+        Parses the CSV file from `source` (a path or file-like object) adding
+        each chunk (see `add`).
+
+        :return: (bool) False if the copy has to be made from the whole file
+        """
+        chunks = pd.read_csv(source, encoding='utf-8', dtype=self.dtype,
+                             chunksize=CHUNK_ROWS, low_memory=False, **kwargs)
+        return all(self.add(chunk) for chunk in chunks)
+
+    def add(self, df):
+        """
+        :param df: (pandas.DataFrame) the next chunk of the CSV file
+        :return: (bool) False if the types of this chunk can't be reconciled
+                 with the ones of the previous chunks (e.g. numbers in one,
+                 strings in another one), then the copy has to be made from
+                 the whole file
+        """
+        if self.empty is None:
+            self.empty = df.iloc[:0]
+            self.categories = {  # the ones in this dataset
+                column: values for column, values in self.categories.items()
+                if column in df.columns
+            }
+        for column, values in self.categories.items():
+            values.update(df[column].dropna().unique())
+
+        batch = pa.RecordBatch.from_pandas(df, preserve_index=False)
+        batch = batch.replace_schema_metadata(None)
+        for field, array in zip(batch.schema, batch.columns):
+            if array.null_count:
+                self.nulls.add(field.name)
+            if array.null_count == len(array):
+                continue  # takes any type
+            known = self.types.setdefault(field.name, field.type)
+            if known != field.type:
+                if {known, field.type} != {pa.int64(), pa.float64()}:
+                    return False
+                self.types[field.name] = pa.float64()
+
+        if batch.schema != self.schema:  # starts another temporary file
+            self.close_writer()
+            self.schema = batch.schema
+            self.paths.append(f'{self.destination}.{len(self.paths)}.tmp')
+            self.sink = pa.OSFile(self.paths[-1], 'wb')
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        self.writer.write_batch(batch)
+        return True
+
+    def close(self):
+        """
+        Writes the columnar copy, recording the version of the CSV file it
+        came from (so the CSV file must have its final name).
+
+        :return: (str) path to the columnar copy, or None if no chunk was
+                 added
+        """
+        self.close_writer()
+        if self.empty is None:
+            return None
+
+        schema, dictionaries = self.final_schema()
+        tmp = self.destination + '.tmp'
+        try:
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                for path in self.paths:
+                    with pa.memory_map(path) as source:
+                        for batch in pa.ipc.open_stream(source):
+                            writer.write_batch(self.cast(batch, schema, dictionaries))
+            os.replace(tmp, self.destination)
+        finally:
+            self.discard()
+        return self.destination
+
+    def discard(self):
+        self.close_writer()
+        for path in self.paths + [self.destination + '.tmp']:
+            if os.path.exists(path):
+                os.remove(path)
+        self.paths = []
+
+    def close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+        self.schema = self.sink = self.writer = None
+
+    def final_schema(self):
+        """
+        The schema `write_columnar` would get from the whole file, with the
+        dictionaries of its categories (their values sorted, as pandas does).
+        """
+        df = self.empty.copy()
+        for column, values in self.categories.items():
+            df[column] = pd.Categorical([], categories=sorted(values))
+
+        types = {}
+        for column in df.columns:
+            if column in self.categories:
+                continue
+            type_ = self.types.get(column)
+            numpy_int = str(self.dtype.get(column, 'int64')) == 'int64'
+            if type_ == pa.int64() and column in self.nulls and numpy_int:
+                type_ = pa.float64()  # blanks turn integers into floats
+            if type_ == pa.float64():
+                df[column] = df[column].astype('float64')
+            elif type_ is not None and pa.types.is_string(type_):
+                df[column] = df[column].astype(object)
+            types[column] = type_
+
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for index, field in enumerate(schema):
+            if types.get(field.name) is not None:
+                schema = schema.set(index, pa.field(field.name, types[field.name]))
+
+        key = source_key(self.path)
+        if key:
+            schema = schema.with_metadata({**schema.metadata, SOURCE_KEY: key})
+        dictionaries = {
+            column: pa.array(sorted(values), pa.string())
+            for column, values in self.categories.items()
+        }
+        return schema, dictionaries
+
+    @staticmethod
+    def cast(batch, schema, dictionaries):
+        arrays = []
+        for array, field in zip(batch.columns, schema):
+            if field.name in dictionaries:
+                dictionary = dictionaries[field.name]
+                indices = pc.index_in(array.cast(pa.string()), value_set=dictionary)
+                indices = indices.cast(field.type.index_type)
+                array = pa.DictionaryArray.from_arrays(indices, dictionary)
+            elif array.type != field.type:
+                array = array.cast(field.type)
+            arrays.append(array)
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class StreamingConverter:
+    """
+    Decompresses and parses a xz compressed CSV in a worker thread while its
+    bytes are still arriving, so the expensive decoding overlaps with the
+    network transfer. The CSV is parsed in chunks of `CHUNK_ROWS` rows
+    written to disk as they are parsed (see `ColumnarWriter`), and once all
+    the bytes are fed (and the compressed file has its final name, as the
+    copy records its version) `close` writes a columnar copy of the dataset
+    next to the compressed file.
+
+    Requires pyarrow (`pip install serenata-toolbox[columnar]`).
+
+    Each converter has its own threads: one for the parser and one for a
+    `feed` waiting for room in the queue. In the loop's shared executor
+    parsers waiting for bytes could take every thread, leaving none for the
+    `feed` that would give them these bytes.
+
+    :param path: (str) the final path of the xz compressed CSV
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.writer = ColumnarWriter(path)
+        self.loop = asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.task = self.executor.submit(self.convert)
+        self.future = asyncio.wrap_future(self.task, loop=self.loop)
+
+    async def feed(self, chunk):
+        try:
+            self.queue.put_nowait(chunk)
+        except Full:  # wait for the parser without blocking the event loop
+            await self.loop.run_in_executor(self.executor, self.put, chunk)
+
+    def put(self, chunk):
+        while not self.task.done():  # gives up if the parser has stopped
+            try:
+                self.queue.put(chunk, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    async def close(self):
+        """
+        Failing to convert the dataset doesn't affect the download itself, so
+        errors are logged and `None` is returned.
+
+        :return: (str) path to the columnar copy
+        """
+        await self.feed(None)
+        try:
+            if await self.future:
+                return await self.loop.run_in_executor(self.executor, self.writer.close)
+
+            # chunks got types that can't be reconciled: parses the whole file
+            self.writer.discard()
+            df = await self.loop.run_in_executor(self.executor, read_csv, self.path)
+            return await self.loop.run_in_executor(self.executor, write_columnar, df, self.path)
+        except Exception as error:
+            log_failure(self.path, error)
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def abort(self):
+        self.future.add_done_callback(lambda future: future.exception())
+        # in case the parser has already finished (otherwise it discards them)
+        self.task.add_done_callback(lambda task: self.writer.discard())
+        while True:  # makes room for the signal, the parser won't need the rest
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        self.queue.put_nowait(Aborted())
+        self.executor.shutdown(wait=False)
+
+    def convert(self):
+        try:
+            with lzma.open(QueueReader(self.queue)) as fobj:
+                return self.writer.write(fobj)
+        except BaseException:
+            self.writer.discard()
+            raise
@@ -0,0 +1,73 @@
+import asyncio
+from time import monotonic
+
+
+class AdaptiveSemaphore:
+    """
+    An async context manager limiting concurrent requests like
+    `asyncio.Semaphore`, but whose limit is tuned while downloads run: it
+    grows by one request while the measured throughput keeps improving,
+    shrinks by one when the throughput drops and is halved when a request
+    fails (additive increase, multiplicative decrease).
+
+    :param maximum: (int) the highest number of concurrent requests
+    :param minimum: (int) the lowest number of concurrent requests
+    :param window: (float) seconds between throughput measurements
+    """
+
+    IMPROVEMENT = 1.05  # throughput ratio considered a real gain
+    DEGRADATION = 0.8  # throughput ratio considered a real loss
+
+    def __init__(self, maximum, minimum=1, window=2.0):
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.limit = min(2, self.maximum)
+        self.window = window
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+        self.throughput = 0
+        self.received = 0
+        self.started_at = monotonic()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.limit = max(self.minimum, self.limit // 2)
+
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def record(self, size):
+        """
+        :param size: (int) number of bytes received by any request
+        """
+        self.received += size
+        elapsed = monotonic() - self.started_at
+        if elapsed < self.window:
+            return
+
+        throughput = self.received / elapsed
+        if throughput > self.throughput * self.IMPROVEMENT:
+            self.limit = min(self.maximum, self.limit + 1)
+            self.notify()
+        elif throughput < self.throughput * self.DEGRADATION:
+            self.limit = max(self.minimum, self.limit - 1)
+
+        self.throughput = throughput
+        self.received = 0
+        self.started_at = monotonic()
+
+    def notify(self):
+        """Wakes up requests waiting for a slot after the limit is raised."""
+
+        async def wake_up():
+            async with self.condition:
+                self.condition.notify_all()
+
+        asyncio.ensure_future(wake_up())
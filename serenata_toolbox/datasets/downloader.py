@@ -1,14 +1,29 @@
 import asyncio
+import json
 import os
+import random
+import warnings
+from hashlib import sha256
+from queue import Queue
+from threading import Thread
 
 import aiofiles
 import aiohttp
 from tqdm import tqdm
 
-from serenata_toolbox import settings
+from serenata_toolbox import log, settings
+from serenata_toolbox.datasets import columnar
+from serenata_toolbox.datasets.cache import CacheManager
+from serenata_toolbox.datasets.concurrency import AdaptiveSemaphore
+from serenata_toolbox.datasets.manifest import PARTIAL_SUFFIX, SIDECAR_SUFFIX, Manifest
+from serenata_toolbox.datasets.loader import EXTENSIONS, newest_versions
+from serenata_toolbox.datasets.remote import object_url, parse_listing
 
 
-MAX_REQUESTS = 4
+CHUNK_SIZE = 2 ** 16  # bytes held in memory per download at a time
+MIN_PART_SIZE = 2 ** 23  # smallest byte range worth its own connection
+CHECKSUM_HEADER = 'x-amz-meta-sha256'  # published as object metadata
+MAX_REQUESTS = settings.DOWNLOAD_MAX_REQUESTS  # deprecated, use `max_requests`
 
 
 class RemoteFileNotFound(Exception):
@@ -20,6 +35,82 @@ class RemoteFileNotFound(Exception):
         return f'HTTP request to {self.url} returned a non 200 status'
 
 
+class ServerError(Exception):
+
+    def __init__(self, url, status):
+        self.url = url
+        self.status = status
+
+    def __str__(self):
+        return f'HTTP request to {self.url} returned a {self.status} status'
+
+
+class RemoteFileChanged(Exception):
+
+    def __init__(self, url):
+        self.url = url
+
+    def __str__(self):
+        return f'{self.url} changed while it was being downloaded'
+
+
+class ChecksumMismatch(Exception):
+
+    def __init__(self, filename, expected, actual):
+        self.filename = filename
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        return (f'SHA-256 of the downloaded {self.filename} is {self.actual}, '
+                f'but {self.expected} was expected')
+
+
+class RetriesExhausted(Exception):
+
+    def __init__(self, filename, attempts, error):
+        self.filename = filename
+        self.attempts = attempts
+        self.error = error
+
+    def __str__(self):
+        return (f'Could not download {self.filename} after {self.attempts} '
+                f'attempts, last error was: {self.error!r}')
+
+
+# errors worth trying again: they might not happen in the next attempt
+TRANSIENT_ERRORS = (
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    RemoteFileChanged,
+    ServerError,
+)
+
+
+class Batch:
+    """
+    The state of a batch of downloads: the sizes known of its files, their
+    total, the progress bar and the bytes of each partial file it counted.
+    Each batch has its own, so batches can run concurrently on the same
+    Downloader.
+
+    :param sizes: (dict) sizes of files known in advance (e.g. listed)
+    """
+
+    def __init__(self, sizes=None):
+        self.sizes = dict(sizes or {})
+        self.total = sum(self.sizes.values())
+        self.progress = None
+        self.counted = {}
+
+
+def check_status(resp, url, expected=(200,)):
+    if resp.status >= 500:
+        raise ServerError(url, resp.status)
+    if resp.status not in expected:
+        raise RemoteFileNotFound(url)
+
+
 class Downloader:
 
     LATEST = (
@@ -62,68 +153,552 @@ class Downloader:
             raise FileNotFoundError(msg.format(self.target))
 
         self.timeout = kwargs.get('timeout')
-        self.semaphore = asyncio.Semaphore(MAX_REQUESTS)
-        self.progress = 0
-        self.total = 0
+        self.chunk_size = kwargs.get('chunk_size') or CHUNK_SIZE
+        self.parts = kwargs.get('parts') or 1
+        self.retries = kwargs.get('retries', settings.DOWNLOAD_RETRIES)
+        self.preflight = kwargs.get('preflight', settings.DOWNLOAD_PREFLIGHT)
+        self.materialize = kwargs.get('materialize', False)
+        if self.materialize and columnar.pa is None:
+            log.warning('Materializing datasets requires pyarrow '
+                        '(pip install serenata-toolbox[columnar]), skipping it')
+            self.materialize = False
+        self.max_requests = kwargs.get('max_requests') or settings.DOWNLOAD_MAX_REQUESTS
+        self.adaptive = kwargs.get('adaptive', settings.DOWNLOAD_ADAPTIVE)
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.manifest = Manifest(self.target)
+        self.cache = CacheManager(
+            self.target,
+            kwargs.get('budget'),
+            kwargs.get('max_age'),
+            kwargs.get('pinned'),
+            self.manifest,
+        )
+
+    @property
+    def semaphore(self):
+        """
+        Limits concurrent requests. It is created lazily, from within the
+        event loop running the downloads, as asyncio primitives are bound to
+        a loop (and a Downloader might be used from more than one).
+        """
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            if self.adaptive:
+                self._semaphore = AdaptiveSemaphore(self.max_requests)
+            else:
+                self._semaphore = asyncio.Semaphore(self.max_requests)
+            self._semaphore_loop = loop
+        return self._semaphore
 
     def download(self, files):
-        if isinstance(files, str):
-            files = [files]
+        """
+        Blocking version of `download_async`, for code not running inside an
+        event loop.
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(self.download_async(files))
 
-        files = tuple(filter(bool, files))
+    async def download_async(self, files, client=None, sizes=None):
+        """
+        Downloads `files` to the target directory. To be awaited from within
+        a running event loop (e.g. a web service or a Jupyter notebook), so it
+        can be composed with other coroutines (for example with
+        `asyncio.gather`, even of batches of the same Downloader).
+
+        If the data directory has a budget (see `CacheManager`) the least
+        recently used datasets are evicted once the batch is downloaded.
+
+        :param files: (str or iterable of str) the file name(s) to download
+        :param client: (aiohttp.ClientSession) an existing session to reuse,
+               if not given a session is created for this batch
+        :param sizes: (dict) sizes of the files known in advance
+        :return: (tuple of str) the local paths of the files
+        """
+        files = self.normalize(files)
         if not files:
             return
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.main(loop, files))
+        await self.main(files, client, sizes)
+        self.cache.evict(keep=files)
+        return tuple(os.path.join(self.target, f) for f in files)
+
+    def as_completed(self, files, order=None):
+        """
+        Blocking version of `as_completed_async`: a generator yielding the
+        local path of each file as soon as its download finishes. Downloads
+        run in a background thread, so they go on while the caller processes
+        the files already downloaded.
+        """
+        results, done = Queue(), object()
+
+        def run():
+            async def consume():
+                try:
+                    async for path in self.as_completed_async(files, order):
+                        results.put(path)
+                except Exception as error:
+                    results.put(error)
+                finally:
+                    results.put(done)
+
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(consume())
+            loop.close()
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        for result in iter(results.get, done):
+            if isinstance(result, Exception):
+                raise result
+            yield result
+        thread.join()
+
+    async def as_completed_async(self, files, order=None, client=None, sizes=None):
+        """
+        Downloads `files` yielding the local path of each one as soon as its
+        download finishes, so processing can start before the whole batch is
+        downloaded. Files failing to download don't stop the others: their
+        errors are logged and the first one is raised in the end.
+
+        :param files: (str or iterable of str) the file name(s) to download
+        :param order: the order downloads start in: `None` to keep the order
+               of `files`, 'smallest' or 'largest' to sort them by size, or a
+               function taking a file name and returning its sort key
+        :param client: (aiohttp.ClientSession) an existing session to reuse,
+               if not given a session is created for this batch
+        :param sizes: (dict) sizes of the files known in advance
+        """
+        files = self.normalize(files)
+        if not files:
+            return
+
+        if client is None:
+            async with aiohttp.ClientSession(connector=self.connector()) as client:
+                async for path in self.as_completed_async(files, order, client, sizes):
+                    yield path
+            return
 
-    async def main(self, loop, files):
         desc = 'Downloading {} files'.format(len(files))
         if len(files) == 1:
             first_file, *_ = files
             desc = 'Downloading {}'.format(first_file)
 
-        async with aiohttp.ClientSession(loop=loop) as client:
+        # fetch total size (files we have a copy of are checked later
+        # with conditional requests instead); without the preflight the
+        # total grows as each download starts
+        errors = {}
+        batch = Batch({f: size for f, size in (sizes or {}).items() if f in files})
+        if self.preflight:
+            unknown = tuple(
+                f for f in files
+                if f not in batch.sizes and not self.manifest.conditional_headers(f)
+            )
+            jobs = [self.with_retries(self.fetch_size, client, f, batch) for f in unknown]
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            errors.update(self.errors(unknown, results))
+
+        # download (a file failing doesn't stop the others); requests wait for
+        # the semaphore in the order their tasks are created
+        async def fetch(filename):
+            try:
+                await self.with_retries(self.fetch_file, client, filename, batch)
+            except Exception as error:
+                errors[filename] = error
+            return filename
+
+        args = dict(total=batch.total, desc=desc, unit='b', unit_scale=True)
+        pending = self.sort(tuple(f for f in files if f not in errors), order, batch.sizes)
+        tasks = [asyncio.ensure_future(fetch(f)) for f in pending]
+        try:
+            with tqdm(**args) as batch.progress:
+                for task in asyncio.as_completed(tasks):
+                    filename = await task
+                    if filename not in errors:
+                        yield os.path.join(self.target, filename)
+
+        # cleanup
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        for error in errors.values():
+            log.error(error)
+        if errors:
+            first, *_ = errors.values()
+            raise first
+
+    def sync(self, prefix=''):
+        """
+        Blocking version of `sync_async`, for code not running inside an
+        event loop.
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(self.sync_async(prefix))
+
+    async def sync_async(self, prefix='', client=None):
+        """
+        Downloads every file in the remote bucket (optionally only the ones
+        whose name starts with `prefix`) that is missing locally or whose size
+        or ETag differ from the local copy, instead of relying on `LATEST`.
 
-            # fetch total size (all files)
-            sizes = [self.fetch_size(client, f) for f in files]
-            await asyncio.gather(*sizes)
+        :param prefix: (str) only sync files whose name starts with it
+        :param client: (aiohttp.ClientSession) an existing session to reuse,
+               if not given a session is created for this sync
+        :return: (tuple of str) the local paths of the files downloaded
+        """
+        if client is None:
+            async with aiohttp.ClientSession(connector=self.connector()) as client:
+                return await self.sync_async(prefix, client)
 
-            # download
-            args = dict(total=self.total, desc=desc, unit='b', unit_scale=True)
-            with tqdm(**args) as progress:
-                self.progress = progress
-                downloads = [self.fetch_file(client, f) for f in files]
-                await asyncio.gather(*downloads)
+        objects = await self.with_retries(self.list_bucket, client, prefix)
+        outdated = tuple(self.outdated(objects))
+        if not outdated:
+            log.info('You already have all the datasets! Nothing to download.')
+            return ()
 
-            # cleanup
-            del self.progress
-            self.total = 0
+        sizes = {obj.key: obj.size for obj in outdated}
+        return await self.download_async(tuple(sizes), client, sizes)
 
-    async def fetch_size(self, client, filename):
-        with (await self.semaphore):
+    async def list_bucket(self, client, prefix=''):
+        """
+        Pages through the bucket listing (only files in its root, as the
+        datasets are stored there).
+
+        :return: (list of RemoteObject) the files in the remote bucket
+        """
+        url, objects = self.url(''), []
+        params = {'list-type': '2', 'delimiter': '/', 'prefix': prefix}
+        while True:
+            async with self.semaphore:
+                async with client.get(url, params=params, timeout=self.timeout) as resp:
+                    check_status(resp, url)
+                    contents = await resp.read()  # a page lists up to 1000 files
+
+            page, token = parse_listing(contents)
+            objects.extend(page)
+            if not token:
+                return objects
+            params['continuation-token'] = token
+
+    def outdated(self, objects):
+        """
+        Filters the remote objects that are missing or differ from the local
+        files. Local files not recorded in the manifest (e.g. downloaded by
+        older versions) are compared by size only.
+
+        If the data directory has a budget (see `CacheManager`) files evicted
+        from it and missing versions older than the newest one of their
+        dataset are skipped (they would be evicted right after), unless
+        they are pinned.
+        """
+        latest = set(newest_versions(obj.key for obj in objects).values())
+        for obj in objects:
+            entry = self.manifest.get(obj.key)
+            local = self.manifest.size(obj.key)
+            if self.cache.enabled and local is None and not self.cache.is_pinned(obj.key):
+                older = obj.key.endswith(EXTENSIONS) and obj.key not in latest
+                if older or self.manifest.is_evicted(obj.key):
+                    continue
+
+            if local != obj.size:
+                yield obj
+            elif entry and entry['etag'] != obj.etag:
+                yield obj
+
+    async def main(self, files, client=None, sizes=None):
+        if isinstance(files, asyncio.AbstractEventLoop):
+            warnings.warn('Downloader.main(loop, files) is deprecated and will be removed in the '
+                          'next major version, use Downloader.main(files)', DeprecationWarning, stacklevel=2)
+            files, client = client, None
+
+        async for _ in self.as_completed_async(files, client=client, sizes=sizes):
+            pass
+
+    @staticmethod
+    def normalize(files):
+        if isinstance(files, str):
+            files = [files]
+        return tuple(filter(bool, files))
+
+    def sort(self, files, order, sizes):
+        def size(filename):
+            local = self.manifest.size(filename)  # likely to be not modified
+            return sizes.get(filename, local or 0)
+
+        if order is None:
+            return files
+        if order == 'smallest':
+            return tuple(sorted(files, key=size))
+        if order == 'largest':
+            return tuple(sorted(files, key=size, reverse=True))
+        return tuple(sorted(files, key=order))
+
+    async def with_retries(self, fetch, client, filename, *args):
+        """
+        Awaits `fetch(client, filename, *args)`, trying again after transient
+        errors (up to `retries` times) with capped exponential backoff and
+        jitter.
+        """
+        for attempt in range(1, self.retries + 2):
+            try:
+                return await fetch(client, filename, *args)
+            except TRANSIENT_ERRORS as error:
+                if attempt > self.retries:
+                    raise RetriesExhausted(filename, attempt, error) from error
+
+                delay = self.backoff(attempt)
+                log.debug(f'{error!r} while downloading {filename}, retrying in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def backoff(attempt):
+        cap = min(settings.DOWNLOAD_BACKOFF_MAX, settings.DOWNLOAD_BACKOFF_BASE * 2 ** (attempt - 1))
+        return random.uniform(0, cap)  # "full jitter"
+
+    @staticmethod
+    def errors(files, results):
+        return {
+            filename: result for filename, result in zip(files, results)
+            if isinstance(result, BaseException)
+        }
+
+    async def fetch_size(self, client, filename, batch):
+        async with self.semaphore:
             async with client.head(self.url(filename)) as resp:
-                if resp.status != 200:
-                    raise RemoteFileNotFound(self.url(filename))
+                check_status(resp, self.url(filename))
+
+                size = int(resp.headers.get('CONTENT-LENGTH', '0'))
 
-                size = resp.headers.get('CONTENT-LENGTH', '0')
+        batch.sizes[filename] = size
+        batch.total += size
 
-        self.total += int(size)
+    async def fetch_file(self, client, filename, batch):
+        """
+        Streams `filename` into a partial file which is renamed to its final
+        name only once the transfer is complete. If a partial file from an
+        interrupted download is found it is resumed with a HTTP Range request
+        (guarded by its ETag through If-Range, so the server sends the whole
+        file again only if the remote file has changed). Otherwise, if we have
+        an intact copy recorded in the manifest, the request is conditional
+        and a `304 Not Modified` response means there's nothing to download.
 
-    async def fetch_file(self, client, filename):
+        Big files whose size is known (from `fetch_size`, so not when
+        `preflight` is disabled) are split in byte ranges downloaded
+        concurrently if the `parts` argument is set.
+
+        The SHA-256 of the file is computed as it is streamed and checked
+        against the one published with the file (or recorded in the manifest
+        for the same ETag) before the file gets its final name.
+
+        With `materialize` set, xz compressed CSVs are also decompressed and
+        parsed while they arrive, and a columnar copy is saved next to them.
+        """
         filepath = os.path.join(self.target, filename)
-        with (await self.semaphore):
-            async with client.get(self.url(filename), timeout=self.timeout) as resp:
-                contents = await resp.read()
+        partial = filepath + PARTIAL_SUFFIX
+        parts = min(self.parts, batch.sizes.get(filename, 0) // MIN_PART_SIZE)
+        if parts > 1 and not self.read_sidecar(partial):
+            return await self.fetch_parts(client, filename, parts, batch)
 
-            async with aiofiles.open(filepath, 'wb') as fh:
-                await fh.write(contents)
+        offset, headers = 0, self.manifest.conditional_headers(filename)
 
-            self.progress.update(len(contents))
+        state = self.read_sidecar(partial)
+        if state.get('etag') and os.path.exists(partial):
+            offset = os.path.getsize(partial)
+            if not 0 < offset < (state.get('size') or float('inf')):
+                offset = 0  # nothing to resume (or nothing left to ask for)
+            else:
+                headers = {'Range': f'bytes={offset}-', 'If-Range': state['etag']}
 
-    def url(self, filename):
-        base = f'https://s3-{settings.AMAZON_REGION}.amazonaws.com'
-        if settings.AMAZON_ENDPOINT:
-            base = settings.AMAZON_ENDPOINT
+        converter = None
+        try:
+            async with self.semaphore:
+                url = self.url(filename)
+                async with client.get(url, headers=headers, timeout=self.timeout) as resp:
+                    if resp.status == 304:
+                        return
+
+                    check_status(resp, url, (200, 206))
+
+                    if resp.status == 200:  # no resume: server ignored Range or file changed
+                        offset = 0
+
+                    size = resp.content_length
+                    if size is not None:
+                        size += offset
+                    self.write_sidecar(partial, size, resp.headers.get('ETag'))
+                    if size and filename not in batch.sizes:  # not accounted by fetch_size
+                        batch.sizes[filename] = size  # nor by a failed attempt
+                        batch.progress.total += size
+                        batch.progress.refresh()
+
+                    checksum = sha256()
+                    if self.materialize and filename.endswith('.xz'):
+                        converter = columnar.StreamingConverter(filepath)
+
+                    if offset:  # the bytes resumed are part of the digest too
+                        for chunk in self.read_chunks(partial):
+                            checksum.update(chunk)
+                            if converter:
+                                await converter.feed(chunk)
+
+                    # counts the bytes resumed, but the ones a failed attempt in
+                    # this batch has already counted (all of them, if restarting)
+                    batch.progress.update(offset - batch.counted.get(partial, 0))
+                    batch.counted[partial] = offset
+                    async with aiofiles.open(partial, 'ab' if offset else 'wb') as fh:
+                        async for chunk in resp.content.iter_chunked(self.chunk_size):
+                            await fh.write(chunk)
+                            checksum.update(chunk)
+                            if converter:
+                                await converter.feed(chunk)
+                            self.received(len(chunk), partial, batch)
 
-        return f'{base}/{settings.AMAZON_BUCKET}/{filename}'
+            self.verify(filename, resp.headers, checksum.hexdigest())
+        except BaseException:
+            if converter:
+                converter.abort()
+            raise
+
+        self.finish(filename, resp.headers, checksum.hexdigest())
+        if converter:
+            await converter.close()
+
+    async def fetch_parts(self, client, filename, parts, batch):
+        """
+        Downloads `filename` in `parts` byte ranges requested concurrently and
+        written in place into a partial file preallocated with the size
+        fetched by `fetch_size`. If the server ignores the Range request the
+        whole file is streamed from the first response instead.
+
+        As ranges arrive out of order the SHA-256 can't be computed on the
+        fly, so the complete file is hashed only if there is a checksum to
+        verify it against. For the same reason, with `materialize` set the
+        columnar copy is created only after the download is complete.
+        """
+        url, size = self.url(filename), batch.sizes[filename]
+        partial = os.path.join(self.target, filename) + PARTIAL_SUFFIX
+        step = -(-size // parts)  # ceil
+        ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+        with open(partial, 'wb') as fobj:
+            fobj.truncate(size)
+        batch.progress.update(-batch.counted.pop(partial, 0))  # by a failed attempt
+
+        async with self.semaphore:
+            (start, end), *others = ranges
+            headers = {'Range': f'bytes={start}-{end}'}
+            async with client.get(url, headers=headers, timeout=self.timeout) as resp:
+                check_status(resp, url, (200, 206))
+
+                if resp.status == 200:  # single stream with the whole file
+                    others = []
+                    open(partial, 'wb').close()
+
+                etag = resp.headers.get('ETag')
+                tasks = [asyncio.ensure_future(self.write_range(resp, partial, start, batch))]
+                tasks.extend(
+                    asyncio.ensure_future(self.fetch_range(client, url, partial, r, etag, batch))
+                    for r in others
+                )
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # no range goes on writing to the partial file (and counting
+                    # its bytes) once a retry starts it from scratch
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+
+        digest = None
+        if self.expected_checksum(filename, resp.headers):
+            digest = self.hash_file(partial, sha256()).hexdigest()
+            self.verify(filename, resp.headers, digest)
+        self.finish(filename, resp.headers, digest)
+
+        if self.materialize and filename.endswith('.xz'):
+            path = os.path.join(self.target, filename)
+            await asyncio.get_event_loop().run_in_executor(None, columnar.convert, path)
+
+    async def fetch_range(self, client, url, partial, byte_range, etag, batch):
+        start, end = byte_range
+        headers = {'Range': f'bytes={start}-{end}'}
+        if etag:
+            headers['If-Range'] = etag
+
+        async with client.get(url, headers=headers, timeout=self.timeout) as resp:
+            check_status(resp, url, (200, 206))
+            if resp.status != 206:
+                raise RemoteFileChanged(url)
+
+            await self.write_range(resp, partial, start, batch)
+
+    async def write_range(self, resp, partial, offset, batch):
+        async with aiofiles.open(partial, 'r+b') as fh:
+            await fh.seek(offset)
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                await fh.write(chunk)
+                self.received(len(chunk), partial, batch)
+
+    def received(self, size, partial, batch):
+        batch.progress.update(size)
+        batch.counted[partial] = batch.counted.get(partial, 0) + size
+        if self.adaptive:
+            self.semaphore.record(size)
+
+    def connector(self):
+        return aiohttp.TCPConnector(
+            limit=self.max_requests * self.parts,
+            limit_per_host=settings.DOWNLOAD_LIMIT_PER_HOST,
+            keepalive_timeout=settings.DOWNLOAD_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.DOWNLOAD_DNS_CACHE_TTL,
+        )
+
+    def expected_checksum(self, filename, headers):
+        return headers.get(CHECKSUM_HEADER) or \
+            self.manifest.checksum(filename, headers.get('ETag'))
+
+    def verify(self, filename, headers, digest):
+        expected = self.expected_checksum(filename, headers)
+        if not expected or expected == digest:
+            return
+
+        partial = os.path.join(self.target, filename) + PARTIAL_SUFFIX
+        for path in (partial, partial + SIDECAR_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        raise ChecksumMismatch(filename, expected, digest)
+
+    def read_chunks(self, path):
+        with open(path, 'rb') as fobj:
+            yield from iter(lambda: fobj.read(self.chunk_size), b'')
+
+    def hash_file(self, path, checksum):
+        for chunk in self.read_chunks(path):
+            checksum.update(chunk)
+        return checksum
+
+    def finish(self, filename, headers, digest=None):
+        filepath = os.path.join(self.target, filename)
+        partial = filepath + PARTIAL_SUFFIX
+        os.replace(partial, filepath)
+        if os.path.exists(partial + SIDECAR_SUFFIX):
+            os.remove(partial + SIDECAR_SUFFIX)
+        self.manifest.update(filename, headers, digest)
+
+    @staticmethod
+    def read_sidecar(partial):
+        try:
+            with open(partial + SIDECAR_SUFFIX) as fobj:
+                return json.load(fobj)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def write_sidecar(partial, size, etag):
+        with open(partial + SIDECAR_SUFFIX, 'w') as fobj:
+            json.dump({'size': size, 'etag': etag}, fobj)
+
+    def url(self, filename):
+        return object_url(filename)
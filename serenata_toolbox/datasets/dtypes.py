@@ -0,0 +1,57 @@
+import os
+import re
+
+from serenata_toolbox.datasets.catalog import parse_filename
+
+
+# columns of each dataset worth parsing as categories (few distinct values),
+# nullable integers (ids) or strings (codes with leading zeros); columns not
+# listed here have their types inferred by pandas
+PRESETS = {
+    'reimbursements': {
+        'applicant_id': 'Int64',
+        'batch_number': 'Int64',
+        'cnpj_cpf': str,
+        'congressperson_document': 'Int64',
+        'congressperson_id': 'Int64',
+        'document_id': 'Int64',
+        'document_type': 'category',
+        'month': 'Int64',
+        'party': 'category',
+        'state': 'category',
+        'subquota_description': 'category',
+        'subquota_group_id': 'Int64',
+        'subquota_number': 'category',
+        'term': 'category',
+        'term_id': 'Int64',
+        'year': 'Int64',
+    },
+    'companies': {
+        'cnpj': str,
+        'state': 'category',
+    },
+}
+
+
+def preset(path):
+    """
+    :param path: (str) path to a dataset (e.g. 2018-01-05-reimbursements.xz
+           or reimbursements-2017.csv)
+    :return: (dict) the dtypes preset for the dataset, empty if there's none
+    """
+    name, _ = parse_filename(os.path.basename(path))
+    name = re.sub(r'-\d{4}$', '', name)  # yearly files, e.g. reimbursements-2017
+    return dict(PRESETS.get(name, {}))
+
+
+def resolve(dtype, path):
+    """
+    :param dtype: None for the preset of the dataset in `path`, the name of
+           a preset (e.g. companies) or a dict mapping columns to dtypes
+    :return: (dict) mapping columns to dtypes
+    """
+    if dtype is None:
+        return preset(path)
+    if isinstance(dtype, str):
+        return dict(PRESETS[dtype])
+    return dict(dtype)
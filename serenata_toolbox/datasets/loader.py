@@ -0,0 +1,312 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import pandas as pd
+
+from serenata_toolbox import settings
+from serenata_toolbox.datasets import columnar, dtypes
+from serenata_toolbox.datasets.catalog import parse_filename
+
+
+EXTENSIONS = ('.xz', '.csv')  # the formats datasets are published in
+CHUNK_SIZE = 10 ** 5  # rows parsed at a time when filtering a CSV file
+
+
+def newest(name, filenames):
+    """
+    :param name: (str) a dataset name (e.g. presences or reimbursements)
+    :param filenames: (iterable of str) date-prefixed file names (e.g.
+           2017-05-29-presences.xz)
+    :return: (str) the most recent version of the dataset in `filenames`, or
+             None if there is none
+    """
+    return newest_versions(filenames).get(name)
+
+
+def newest_versions(filenames):
+    """
+    Groups `filenames` by dataset in a single pass (to be used instead of
+    calling `newest` for each dataset).
+
+    :param filenames: (iterable of str) date-prefixed file names
+    :return: (dict) the most recent version of each dataset in `filenames`,
+             by dataset name
+    """
+    latest = {}
+    for filename in filenames:
+        if not filename.endswith(EXTENSIONS):
+            continue
+        name, date = parse_filename(filename)
+        version = (date or '', filename)
+        if name not in latest or version > latest[name]:
+            latest[name] = version
+    return {name: filename for name, (_, filename) in latest.items()}
+
+
+def read(path, columns=None, dtype=None, filters=None, cache=True, **kwargs):
+    """
+    Reads a dataset into a `pandas.DataFrame`, only what is needed.
+
+    :param path: (str) path to the dataset
+    :param columns: (list of str) only read these columns
+    :param dtype: None for the preset of the dataset (see `dtypes.PRESETS`,
+           e.g. categories for state and party and nullable integers for
+           ids), the name of a preset or a dict mapping columns to dtypes
+    :param filters: (dict) only keep rows matching all of these (see
+           `select`), e.g. `{'year': 2017, 'state': ['SP', 'RJ']}`
+    :param cache: (bool) read through the columnar copy (see
+           `columnar.load`), unless other keyword arguments are given or the
+           dtypes don't include the preset, as the copy is parsed with it
+    :param kwargs: passed to `pandas.read_csv`
+    """
+    touch(path)
+    dtype, filters = dtypes.resolve(dtype, path), filters or {}
+    needed = needed_columns(columns, filters)
+
+    df = None
+    if cache and not kwargs and is_preset(dtype, path):
+        df = columnar.load(path, needed, dtype)
+
+    if df is None:
+        if filters:  # drops rows as they are parsed, not to hold them all
+            parsed = read_chunks(path, CHUNK_SIZE, needed, filters, dtype=dtype, **kwargs)
+            df = concat(list(parsed), dtype)
+        else:
+            kwargs.setdefault('encoding', 'utf-8')
+            kwargs.setdefault('low_memory', False)
+            df = pd.read_csv(path, dtype=dtype, usecols=needed, **kwargs)
+    elif filters:
+        df = select(df, filters)
+
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def chunks(path, chunksize=CHUNK_SIZE, columns=None, dtype=None, filters=None,
+           cache=True, **kwargs):
+    """
+    Reads a dataset in chunks of up to `chunksize` rows, so it can be
+    processed (e.g. aggregated or exported) with memory bounded by the size
+    of the chunks, not of the dataset. Arguments are the same as `read`'s,
+    rows not matching `filters` are dropped from each chunk (chunks left
+    empty are skipped).
+
+    The up to date columnar copy of the dataset is used if there is one
+    (it's memory-mapped, so it's not loaded at once), otherwise the CSV file
+    is parsed in chunks. As each chunk is read on its own, the categories of
+    categorical columns may differ from chunk to chunk.
+
+    :return: (generator of pandas.DataFrame)
+    """
+    touch(path)
+    dtype, filters = dtypes.resolve(dtype, path), filters or {}
+    needed = needed_columns(columns, filters)
+
+    table = None
+    if cache and not kwargs and is_preset(dtype, path):
+        table = columnar.read_columnar(path, needed)
+        if table is not None and not columnar.strings_compatible(table, dtype):
+            table = None
+
+    if table is None:
+        parsed = read_chunks(path, chunksize, needed, filters, dtype=dtype, **kwargs)
+    else:
+        parsed = (
+            select(columnar.cast(batch.to_pandas(split_blocks=True), dtype), filters)
+            for batch in table.to_batches(max_chunksize=chunksize)
+        )
+
+    for chunk in parsed:
+        if not chunk.empty:
+            yield chunk if columns is None else chunk[list(columns)]
+
+
+def read_chunks(path, chunksize, columns, filters, **kwargs):
+    kwargs.setdefault('encoding', 'utf-8')
+    kwargs.setdefault('low_memory', False)
+    kwargs.update(chunksize=chunksize, usecols=columns)
+    for chunk in pd.read_csv(path, **kwargs):
+        yield select(chunk, filters) if filters else chunk
+
+
+def needed_columns(columns, filters):
+    if columns is None:
+        return None
+    return list(columns) + [c for c in filters if c not in columns]  # filtered too
+
+
+def is_preset(dtype, path):
+    return all(dtype.get(k) == v for k, v in dtypes.preset(path).items())
+
+
+def select(df, filters):
+    """
+    :param df: (pandas.DataFrame)
+    :param filters: (dict) maps columns to a value, a list (or tuple, or set)
+           of values or a function taking the column (a `pandas.Series`) and
+           returning a boolean mask
+    :return: (pandas.DataFrame) the rows matching all filters
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, value in filters.items():
+        if callable(value):
+            mask &= value(df[column])
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            mask &= df[column].isin(value)
+        else:
+            mask &= df[column] == value
+    return df[mask]
+
+
+def concat(chunks, dtype):
+    """
+    Concatenates chunks keeping categorical columns categorical (each chunk
+    has its own categories, so pandas would fall back to object).
+    """
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks, ignore_index=True)
+    categories = {
+        column: 'category' for column, value in dtype.items()
+        if str(value) == 'category' and column in df.columns
+    }
+    return df.astype(categories) if categories else df
+
+
+def touch(path):
+    """
+    Records that the dataset in `path` has just been used (in its access
+    time, as the modification time identifies its version), as the least
+    recently used datasets are the first to go when the data directory is
+    over its budget (see `CacheManager`).
+    """
+    try:
+        os.utime(path, ns=(int(time.time() * 1e9), os.stat(path).st_mtime_ns))
+    except OSError:
+        pass
+
+
+def freeze(value):
+    """Hashable version of `read` arguments (e.g. lists and dicts)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class Memo:
+    """
+    Keeps the last `maxsize` datasets read in memory, so reading the same
+    dataset again in the same process doesn't parse it again. Entries are
+    keyed by path, modification time, size and the `read` arguments (e.g.
+    the columns or dtypes requested), so an entry is not used (and is
+    dropped) once its file changes on disk.
+
+    Frames are shared by whoever reads the same dataset: add or replace
+    columns freely (each read gets a shallow copy) but copy the frame before
+    modifying its values in place.
+
+    :param maxsize: (int) how many datasets to keep, 0 disables the memo
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = settings.DATA_MEMO_SIZE if maxsize is None else maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, path, **kwargs):
+        try:
+            stat = os.stat(path)
+            key = (path, stat.st_mtime_ns, stat.st_size, freeze(kwargs))
+            hash(key)
+        except (OSError, TypeError):  # let read raise or skip the memo
+            return read(path, **kwargs)
+
+        with self.lock:
+            df = self.entries.get(key)
+            if df is not None:
+                self.entries.move_to_end(key)
+        if df is not None:
+            touch(path)
+            return df.copy(deep=False)
+
+        df = read(path, **kwargs)
+        if self.maxsize > 0:
+            with self.lock:
+                for stale in [k for k in self.entries if k[0] == path and k[1:3] != key[1:3]]:
+                    del self.entries[stale]
+                self.entries[key] = df
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return df.copy(deep=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+memo = Memo()  # shared by the whole process
+
+
+class LazyDataset:
+    """
+    A dataset that is only resolved (and downloaded, if needed) and parsed
+    when its data is first accessed. Attributes and items not defined here
+    are the ones of the underlying `pandas.DataFrame`, so in most cases it
+    can be used as one (e.g. `dataset.head()` or `dataset['cnpj']`).
+
+    :param name: (str) the dataset name (e.g. reimbursements)
+    :param resolve: (callable) returns the path of the file to read
+    :param reader: (callable) reads the file, defaults to `read`
+    :param kwargs: passed to `reader`
+    """
+
+    def __init__(self, name, resolve, reader=read, **kwargs):
+        self.name = name
+        self.kwargs = kwargs
+        self._resolve = resolve
+        self._reader = reader
+        self._path = None
+        self._frame = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = self._resolve()
+        return self._path
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = self._reader(self.path, **self.kwargs)
+        return self._frame
+
+    @property
+    def is_loaded(self):
+        return self._frame is not None
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):  # not to load the data on copy, pickle etc.
+            raise AttributeError(attr)
+        return getattr(self.frame, attr)
+
+    def __getitem__(self, key):
+        return self.frame[key]
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __iter__(self):
+        return iter(self.frame)
+
+    def __repr__(self):
+        if not self.is_loaded:
+            return f'<LazyDataset {self.name} (not loaded)>'
+        return repr(self.frame)
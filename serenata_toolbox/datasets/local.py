@@ -1,5 +1,6 @@
 import os
 
+from serenata_toolbox.datasets.catalog import Catalog, is_bookkeeping
 from serenata_toolbox.datasets.contextmanager import status_message
 
 
@@ -10,10 +11,19 @@ class LocalDatasets:
             raise FileNotFoundError('{} is not a directory'.format(directory))
 
         self.directory = os.path.abspath(directory)
+        self.catalog = Catalog(self.directory)
 
     @property
     def all(self):
-        yield from filter(self._is_file, os.listdir(self.directory))
+        with os.scandir(self.directory) as scan:
+            yield from (item.name for item in scan if self._is_file(item))
+
+    def describe(self):
+        """
+        :return: (dict) the catalog entry of each local dataset (size, date
+                 stamp, row count, schema etc.), indexed by file name
+        """
+        return self.catalog.refresh()
 
     def delete(self, file_name):
         full_path = os.path.join(self.directory, file_name)
@@ -23,6 +33,6 @@ class LocalDatasets:
         with status_message('Deleting {}…'.format(file_name)):
             os.remove(full_path)
 
-    def _is_file(self, filename):
-        full_path = os.path.join(self.directory, filename)
-        return os.path.isfile(full_path)
+    @staticmethod
+    def _is_file(item):
+        return not is_bookkeeping(item.name) and item.is_file()
@@ -0,0 +1,117 @@
+import json
+import os
+
+
+FILENAME = '.manifest.json'
+PARTIAL_SUFFIX = '.part'  # unfinished downloads
+SIDECAR_SUFFIX = '.json'  # state of unfinished downloads, next to them
+
+
+class Manifest:
+    """
+    Records the validators (ETag and Last-Modified headers) and the size of
+    every file downloaded into a directory, so later downloads can use
+    conditional requests and get a cheap `304 Not Modified` answer if the
+    remote file hasn't changed.
+
+    :param directory: (str) the directory where the datasets are stored
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, FILENAME)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as fobj:
+                return json.load(fobj)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fobj:
+            json.dump(self.entries, fobj, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def update(self, filename, headers, sha256=None):
+        """
+        :param filename: (str) a file that has just been downloaded
+        :param headers: (mapping) the headers of the response it came from
+        :param sha256: (str) the hex digest of the file contents, if known
+        """
+        self.entries[filename] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'sha256': sha256,
+            'size': self.size(filename),
+        }
+        self.save()
+
+    def evict(self, filename):
+        """
+        Records that `filename` was deleted to save space (see
+        `CacheManager`), so syncs don't download it again. Downloading it
+        again (e.g. explicitly) clears the record.
+        """
+        entry = self.get(filename) or {
+            'etag': None,
+            'last_modified': None,
+            'sha256': None,
+            'size': None,
+        }
+        self.entries[filename] = {**entry, 'evicted': True}
+        self.save()
+
+    def is_evicted(self, filename):
+        entry = self.get(filename)
+        return bool(entry and entry.get('evicted'))
+
+    def checksum(self, filename, etag):
+        """
+        The SHA-256 recorded for `filename`, as long as it was recorded for
+        the same version of the remote file (i.e. the same ETag).
+        """
+        entry = self.get(filename)
+        if not entry or not etag or entry['etag'] != etag:
+            return None
+        return entry.get('sha256')
+
+    def is_intact(self, filename):
+        """
+        Returns False if the local file is missing or if its size differs from
+        the one recorded when it was downloaded (e.g. it is corrupted). Files
+        never recorded in the manifest are assumed to be intact.
+        """
+        size = self.size(filename)
+        if size is None:
+            return False
+
+        entry = self.get(filename)
+        return entry is None or entry['size'] == size
+
+    def conditional_headers(self, filename):
+        """
+        Headers to ask the server for `filename` only if it has changed since
+        it was downloaded. Empty unless we have an intact, recorded copy.
+        """
+        entry = self.get(filename)
+        if not entry or not self.is_intact(filename):
+            return {}
+
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def size(self, filename):
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            return None
+        return os.path.getsize(path)
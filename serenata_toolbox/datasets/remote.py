@@ -0,0 +1,129 @@
+import hmac
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import datetime
+from hashlib import sha256
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from serenata_toolbox import settings
+
+
+EMPTY_PAYLOAD = sha256(b'').hexdigest()
+
+
+RemoteObject = namedtuple('RemoteObject', ('key', 'size', 'etag', 'last_modified'))
+
+
+def object_url(key):
+    """
+    :param key: (str) the name of a file in the remote bucket
+    :return: (str) its URL (path-style, so it works with S3-compatible
+             services set in `AMAZON_ENDPOINT` as well)
+    """
+    base = f'https://s3-{settings.AMAZON_REGION}.amazonaws.com'
+    if settings.AMAZON_ENDPOINT:
+        base = settings.AMAZON_ENDPOINT
+
+    return f'{base}/{settings.AMAZON_BUCKET}/{key}'
+
+
+def strip_namespaces(root):
+    for node in root.iter():  # ignore namespaces, not every server uses them
+        node.tag = node.tag.rpartition('}')[-1]
+    return root
+
+
+def parse_listing(contents):
+    """
+    Parses a page of a S3-compatible bucket listing (ListObjectsV2).
+
+    :param contents: (bytes) the XML returned by the listing request
+    :return: (tuple) the list of `RemoteObject` in this page and the token to
+             request the next page (`None` if this is the last one)
+    """
+    root = strip_namespaces(ET.fromstring(contents))
+    objects = [
+        RemoteObject(
+            node.findtext('Key'),
+            int(node.findtext('Size')),
+            node.findtext('ETag'),
+            node.findtext('LastModified'),
+        )
+        for node in root.findall('Contents')
+    ]
+
+    token = None
+    if root.findtext('IsTruncated') == 'true':
+        token = root.findtext('NextContinuationToken')
+
+    return objects, token
+
+
+class Signer:
+    """
+    Signs requests to the S3-compatible API with AWS Signature Version 4, so
+    the toolbox doesn't need an extra dependency just to write to the bucket.
+
+    :param access_key: (str) the access key ID
+    :param secret_key: (str) the secret access key
+    :param region: (str) the region of the bucket (e.g. us-east-1 or nyc3)
+    """
+
+    ALGORITHM = 'AWS4-HMAC-SHA256'
+
+    def __init__(self, access_key, secret_key, region):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+
+    def sign(self, method, url, headers=None, payload_hash=EMPTY_PAYLOAD, now=None):
+        """
+        :param method: (str) the HTTP method
+        :param url: (str) the URL, with its query string already encoded
+        :param headers: (dict) headers to be signed along with the request
+        :param payload_hash: (str) the hex SHA-256 of the request body
+        :param now: (datetime) the UTC time of the request, defaults to now
+        :return: (dict) `headers` plus the ones carrying the signature
+        """
+        now = now or datetime.utcnow()
+        timestamp, date = now.strftime('%Y%m%dT%H%M%SZ'), now.strftime('%Y%m%d')
+        scope = f'{date}/{self.region}/s3/aws4_request'
+
+        parts = urlsplit(url)
+        signed = dict(headers or {})
+        signed.update({
+            'host': parts.netloc,
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': timestamp,
+        })
+        canonical_headers = {k.lower(): ' '.join(str(v).split()) for k, v in signed.items()}
+        names = ';'.join(sorted(canonical_headers))
+
+        query = sorted(
+            (quote(k, safe='-_.~'), quote(v, safe='-_.~'))
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        )
+        canonical_request = '\n'.join((
+            method,
+            quote(parts.path or '/', safe='/-_.~%'),
+            '&'.join(f'{k}={v}' for k, v in query),
+            ''.join(f'{k}:{v}\n' for k, v in sorted(canonical_headers.items())),
+            names,
+            payload_hash,
+        ))
+        string_to_sign = '\n'.join((
+            self.ALGORITHM,
+            timestamp,
+            scope,
+            sha256(canonical_request.encode()).hexdigest(),
+        ))
+
+        key = f'AWS4{self.secret_key}'.encode()
+        for value in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, value.encode(), sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), sha256).hexdigest()
+
+        signed['Authorization'] = (f'{self.ALGORITHM} Credential={self.access_key}/{scope}, '
+                                   f'SignedHeaders={names}, Signature={signature}')
+        del signed['host']  # set by the HTTP client
+        return signed
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import xml.etree.ElementTree as ET
+from hashlib import sha256
+
+import aiofiles
+import aiohttp
+from tqdm import tqdm
+from yarl import URL
+
+from serenata_toolbox import log, settings
+from serenata_toolbox.datasets.downloader import (
+    CHECKSUM_HEADER,
+    TRANSIENT_ERRORS,
+    Downloader,
+    check_status,
+)
+from serenata_toolbox.datasets.remote import Signer, object_url, strip_namespaces
+
+
+MIN_PART_SIZE = 5 * 2 ** 20  # smallest part (but the last) S3 accepts
+
+
+class UploadFailed(Exception):
+
+    def __init__(self, filename, attempts, error):
+        self.filename = filename
+        self.attempts = attempts
+        self.error = error
+
+    def __str__(self):
+        return (f'Could not upload {self.filename} after {self.attempts} '
+                f'attempts, last error was: {self.error!r}')
+
+
+class Uploader:
+    """
+    The upload counterpart to `Downloader`: publishes files from a local
+    directory (e.g. the datasets generated by the toolbox) to the remote
+    bucket, using `AMAZON_ACCESS_KEY` and `AMAZON_SECRET_KEY`.
+
+    Files bigger than `part_size` are sent as multipart uploads with their
+    parts uploaded concurrently. The SHA-256 of each file is published as
+    object metadata (the same the Downloader verifies), so files whose remote
+    copy has the same checksum are skipped.
+
+    :param source: (str) path to the directory where the files are
+    :param timeout: (float) timeout for each request, None disables it
+    :param part_size: (int) size in bytes of each part of multipart uploads
+    :param max_requests: (int) maximum number of concurrent requests
+    :param retries: (int) attempts after a transient error before giving up
+    :param acl: (str) the canned ACL of the uploaded files
+    """
+
+    def __init__(self, source, **kwargs):
+        self.source = os.path.abspath(source)
+        if not all((os.path.exists(self.source), os.path.isdir(self.source))):
+            msg = '{} does not exist or is not a directory.'
+            raise FileNotFoundError(msg.format(self.source))
+
+        self.timeout = kwargs.get('timeout')
+        self.part_size = max(MIN_PART_SIZE, kwargs.get('part_size') or settings.UPLOAD_PART_SIZE)
+        self.max_requests = kwargs.get('max_requests') or settings.DOWNLOAD_MAX_REQUESTS
+        self.retries = kwargs.get('retries', settings.DOWNLOAD_RETRIES)
+        self.acl = kwargs.get('acl', settings.UPLOAD_ACL)
+        self.signer = Signer(
+            settings.AMAZON_ACCESS_KEY,
+            settings.AMAZON_SECRET_KEY,
+            settings.AMAZON_REGION,
+        )
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.progress = 0
+
+    @property
+    def semaphore(self):
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_requests)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def upload(self, files):
+        """
+        Blocking version of `upload_async`, for code not running inside an
+        event loop.
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(self.upload_async(files))
+
+    async def upload_async(self, files, client=None):
+        """
+        Uploads `files` to the remote bucket, keeping their names. A file
+        failing to upload doesn't stop the others: errors are logged and the
+        first one is raised in the end.
+
+        :param files: (str or iterable of str) the file name(s) to upload
+        :param client: (aiohttp.ClientSession) an existing session to reuse
+               (e.g. the one used by a Downloader), if not given a session is
+               created for this batch
+        :return: (tuple of str) the names of the files uploaded (i.e. not
+                 skipped for being unchanged)
+        """
+        files = Downloader.normalize(files)
+        if not files:
+            return
+
+        if client is None:
+            async with aiohttp.ClientSession(connector=self.connector()) as client:
+                return await self.upload_async(files, client)
+
+        sizes = {f: os.path.getsize(os.path.join(self.source, f)) for f in files}
+        desc = 'Uploading {} files'.format(len(files))
+        if len(files) == 1:
+            desc = 'Uploading {}'.format(files[0])
+
+        args = dict(total=sum(sizes.values()), desc=desc, unit='b', unit_scale=True)
+        try:
+            with tqdm(**args) as progress:
+                self.progress = progress
+                jobs = (self.with_retries(self.upload_file, client, f) for f in files)
+                results = await asyncio.gather(*jobs, return_exceptions=True)
+        finally:
+            self.progress = 0
+
+        errors = Downloader.errors(files, results)
+        for error in errors.values():
+            log.error(error)
+        if errors:
+            first, *_ = errors.values()
+            raise first
+
+        return tuple(f for f, uploaded in zip(files, results) if uploaded)
+
+    async def with_retries(self, upload, client, filename, *args):
+        for attempt in range(1, self.retries + 2):
+            try:
+                return await upload(client, filename, *args)
+            except TRANSIENT_ERRORS as error:
+                if attempt > self.retries:
+                    raise UploadFailed(filename, attempt, error) from error
+
+                delay = Downloader.backoff(attempt)
+                log.debug(f'{error!r} while uploading {filename}, retrying in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+    async def upload_file(self, client, filename):
+        """
+        :return: (bool) False if the remote file is unchanged and the upload
+                 was skipped
+        """
+        path = os.path.join(self.source, filename)
+        loop = asyncio.get_event_loop()
+        digest = await loop.run_in_executor(None, self.hash_file, path)
+        if await self.remote_checksum(client, filename) == digest:
+            log.info(f'Skipping {filename}: remote file is up to date')
+            self.progress.update(os.path.getsize(path))
+            return False
+
+        headers = {CHECKSUM_HEADER: digest}
+        if self.acl:
+            headers['x-amz-acl'] = self.acl
+
+        size = os.path.getsize(path)
+        if size <= self.part_size:
+            async with self.semaphore:
+                contents = await self.read_part(path, 0, size)
+                await self.request(client, 'PUT', filename, headers=headers, data=contents)
+            self.progress.update(size)
+        else:
+            await self.upload_parts(client, filename, path, size, headers)
+        return True
+
+    async def upload_parts(self, client, filename, path, size, headers):
+        """
+        Each part is retried on its own, so a transient error doesn't start
+        the whole upload again. If a part still fails, the other ones are
+        cancelled (and awaited) before the multipart upload is aborted, so no
+        part reaches an aborted upload.
+        """
+        async with self.semaphore:
+            resp = await self.request(client, 'POST', filename, 'uploads', headers=headers)
+        upload_id = strip_namespaces(ET.fromstring(resp)).findtext('UploadId')
+        query = f'uploadId={upload_id}'
+
+        offsets = range(0, size, self.part_size)
+        tasks = [
+            asyncio.ensure_future(self.with_retries(
+                self.upload_part, client, filename, path, query, number, offset
+            ))
+            for number, offset in enumerate(offsets, 1)
+        ]
+        try:
+            parts = await asyncio.gather(*tasks)
+            body = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                for number, etag in parts
+            )
+            body = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode()
+            async with self.semaphore:
+                await self.request(client, 'POST', filename, query, data=body)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # not to be billed for the parts already sent (and to start from
+            # scratch when retrying)
+            await asyncio.shield(self.abort(client, filename, query, tasks))
+            raise
+
+    async def upload_part(self, client, filename, path, query, number, offset):
+        async with self.semaphore:  # parts are read only when they can be sent
+            contents = await self.read_part(path, offset, self.part_size)
+            part = f'partNumber={number}&{query}'
+            etag = await self.request(client, 'PUT', filename, part, data=contents, etag=True)
+        self.progress.update(len(contents))
+        return number, etag
+
+    async def abort(self, client, filename, query, tasks=()):
+        """Aborts a multipart upload once its `tasks` (parts) are finished."""
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            async with self.semaphore:
+                await self.request(client, 'DELETE', filename, query, expected=(204,))
+        except Exception as error:
+            log.error(f'Could not abort the multipart upload of {filename}: {error!r}')
+
+    async def remote_checksum(self, client, filename):
+        url = object_url(filename)
+        async with self.semaphore:
+            headers = self.signer.sign('HEAD', url)
+            async with client.head(URL(url, encoded=True), headers=headers,
+                                   timeout=self.timeout) as resp:
+                if resp.status == 404:
+                    return None
+                check_status(resp, url)
+                return resp.headers.get(CHECKSUM_HEADER)
+
+    async def request(self, client, method, filename, query='', headers=None,
+                      data=b'', etag=False, expected=(200,)):
+        """
+        Sends a signed request about `filename` to the bucket. Callers hold
+        the semaphore, so the request is signed right before it is sent.
+
+        :return: (bytes or str) the response body, or its ETag if `etag`
+        """
+        url = object_url(filename)
+        if query:
+            url = f'{url}?{query}'
+
+        payload_hash = sha256(data).hexdigest()
+        headers = self.signer.sign(method, url, headers, payload_hash)
+        async with client.request(method, URL(url, encoded=True), headers=headers,
+                                  data=data, timeout=self.timeout) as resp:
+            check_status(resp, url, expected)
+            if etag:
+                return resp.headers.get('ETag')
+            return await resp.read()
+
+    @staticmethod
+    async def read_part(path, offset, size):
+        async with aiofiles.open(path, 'rb') as fh:
+            await fh.seek(offset)
+            return await fh.read(size)
+
+    @staticmethod
+    def hash_file(path):
+        checksum = sha256()
+        with open(path, 'rb') as fobj:
+            for chunk in iter(lambda: fobj.read(2 ** 16), b''):
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def connector(self):
+        return aiohttp.TCPConnector(
+            limit=self.max_requests,
+            limit_per_host=settings.DOWNLOAD_LIMIT_PER_HOST,
+            keepalive_timeout=settings.DOWNLOAD_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.DOWNLOAD_DNS_CACHE_TTL,
+        )
@@ -1,6 +1,29 @@
-from decouple import config
+from decouple import Csv, config
 
 
 AMAZON_REGION = config('AMAZON_REGION', default='nyc3')
 AMAZON_BUCKET = config('AMAZON_BUCKET', default='serenata-de-amor-data')
 AMAZON_ENDPOINT = config('AMAZON_ENDPOINT', default='https://nyc3.digitaloceanspaces.com')
+
+DOWNLOAD_MAX_REQUESTS = config('DOWNLOAD_MAX_REQUESTS', default=4, cast=int)
+DOWNLOAD_LIMIT_PER_HOST = config('DOWNLOAD_LIMIT_PER_HOST', default=0, cast=int)
+DOWNLOAD_KEEPALIVE_TIMEOUT = config('DOWNLOAD_KEEPALIVE_TIMEOUT', default=15.0, cast=float)
+DOWNLOAD_DNS_CACHE_TTL = config('DOWNLOAD_DNS_CACHE_TTL', default=300, cast=int)
+DOWNLOAD_ADAPTIVE = config('DOWNLOAD_ADAPTIVE', default=False, cast=bool)
+DOWNLOAD_PREFLIGHT = config('DOWNLOAD_PREFLIGHT', default=True, cast=bool)
+DOWNLOAD_RETRIES = config('DOWNLOAD_RETRIES', default=5, cast=int)
+DOWNLOAD_BACKOFF_BASE = config('DOWNLOAD_BACKOFF_BASE', default=0.5, cast=float)
+DOWNLOAD_BACKOFF_MAX = config('DOWNLOAD_BACKOFF_MAX', default=30.0, cast=float)
+
+AMAZON_ACCESS_KEY = config('AMAZON_ACCESS_KEY', default='')
+AMAZON_SECRET_KEY = config('AMAZON_SECRET_KEY', default='')
+UPLOAD_ACL = config('UPLOAD_ACL', default='public-read')
+UPLOAD_PART_SIZE = config('UPLOAD_PART_SIZE', default=2 ** 24, cast=int)
+
+DATA_BUDGET = config('DATA_BUDGET', default=0, cast=int)
+DATA_MAX_AGE = config('DATA_MAX_AGE', default=0, cast=float)
+DATA_PINNED = config('DATA_PINNED', default='', cast=Csv())
+DATA_MEMO_SIZE = config('DATA_MEMO_SIZE', default=4, cast=int)
+
+REIMBURSEMENTS_CHUNK_SIZE = config('REIMBURSEMENTS_CHUNK_SIZE', default=0, cast=int)
+REIMBURSEMENTS_BUFFER_ROWS = config('REIMBURSEMENTS_BUFFER_ROWS', default=10 ** 6, cast=int)
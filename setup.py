@@ -28,6 +28,9 @@ setup(
         'python-decouple>=3.1',
         'tqdm'
     ],
+    extras_require={
+        'columnar': ['pyarrow'],
+    },
     keywords='serenata de amor, data science, brazil, corruption',
     license='MIT',
     long_description=long_description,
@@ -41,5 +44,5 @@ setup(
     scripts=['serenata_toolbox/serenata-toolbox'],
     url=REPO_URL,
     python_requires='>=3.6',
-    version='15.1.6',
+    version='15.26.0',
 )
@@ -1,9 +1,13 @@
 import os.path
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from threading import Event
 from unittest import TestCase
 from unittest.mock import patch
+from zipfile import ZipFile
 
 from serenata_toolbox.chamber_of_deputies.reimbursements import \
-    URL, Reimbursements
+    URL, MultiYearReimbursements, Reimbursements, extract_zip
 
 
 class TestReimbursements(TestCase):
@@ -23,23 +27,87 @@ class TestReimbursements(TestCase):
         file_path = os.path.join(self.subject.path, 'reimbursements-2017.csv')
         self.assertEqual(file_path, self.subject())
 
-    @patch('serenata_toolbox.chamber_of_deputies.reimbursements.extract_zip')
     @patch('serenata_toolbox.chamber_of_deputies.reimbursements.urlretrieve')
-    def test_fetch_download_zip_file(self, urlretrieve_mock, _):
+    def test_fetch_download_zip_file(self, urlretrieve_mock):
         url = URL.format(2017)
         path = os.path.join(self.subject.path, 'Ano-2017.zip')
         self.subject.fetch()
         urlretrieve_mock.assert_called_with(url, path)
 
-    @patch('serenata_toolbox.chamber_of_deputies.reimbursements.extract_zip')
-    @patch('serenata_toolbox.chamber_of_deputies.reimbursements.urlretrieve')
-    def test_fetch_extract_zip(self, _, extract_zip_mock):
-        file_path = os.path.join(self.subject.path, 'Ano-2017.zip')
-        path = self.subject.path
-        self.subject.fetch()
-        extract_zip_mock.assert_called_with(file_path, path)
-
     @patch('serenata_toolbox.chamber_of_deputies.reimbursements.ReimbursementsCleaner')
     def test_clean_delegate_to_reimbursements_cleaner(self, cleaner_mock):
         self.subject.clean()
         cleaner_mock.return_value.assert_called_with()
+
+
+class TestExtractZip(TestCase):
+    def test_extract_zip_is_deprecated(self):
+        with TemporaryDirectory() as path:
+            zip_path = os.path.join(path, 'Ano-2017.zip')
+            with ZipFile(zip_path, 'w') as zip_file:
+                zip_file.writestr('Ano-2017.csv', 'txNomeParlamentar\n')
+            with self.assertWarns(DeprecationWarning):
+                extract_zip(zip_path, path)
+            with open(os.path.join(path, 'Ano-2017.csv')) as fobj:
+                self.assertEqual('txNomeParlamentar\n', fobj.read())
+
+
+@patch('serenata_toolbox.chamber_of_deputies.reimbursements.ProcessPoolExecutor',
+       ThreadPoolExecutor)
+class TestMultiYearReimbursements(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_max_workers_is_bound_by_the_years(self):
+        subject = MultiYearReimbursements([2017, 2018], self.path, max_workers=8)
+        self.assertEqual(2, subject.max_workers)
+        subject = MultiYearReimbursements([2016, 2017, 2018], self.path, max_workers=2)
+        self.assertEqual(2, subject.max_workers)
+
+    def test_repeated_years_are_built_once(self):
+        subject = MultiYearReimbursements([2017, '2017', 2018], self.path)
+        self.assertEqual(['2017', '2018'], subject.years)
+
+    @patch.object(Reimbursements, 'clean')
+    @patch.object(Reimbursements, 'fetch')
+    def test_call_fetch_and_clean_every_year(self, fetch_mock, clean_mock):
+        subject = MultiYearReimbursements([2017, 2018], self.path)
+        paths = subject()
+        self.assertEqual(2, fetch_mock.call_count)
+        self.assertEqual(2, clean_mock.call_count)
+        self.assertEqual([
+            os.path.join(self.path, 'reimbursements-2017.csv'),
+            os.path.join(self.path, 'reimbursements-2018.csv'),
+        ], paths)
+        for year in ('2017', '2018'):
+            self.assertEqual({'fetch', 'clean'}, set(subject.timings[year]))
+
+    def test_call_clean_years_while_others_are_fetched(self):
+        cleaned = Event()
+
+        def fetch(reimbursements):
+            if reimbursements.year == '2018':  # only finishes after 2017 is cleaned
+                self.assertTrue(cleaned.wait(timeout=5))
+
+        def clean(reimbursements):
+            if reimbursements.year == '2017':
+                cleaned.set()
+
+        with patch.object(Reimbursements, 'fetch', fetch), \
+                patch.object(Reimbursements, 'clean', clean):
+            MultiYearReimbursements([2017, 2018], self.path)()
+        self.assertTrue(cleaned.is_set())
+
+    @patch.object(Reimbursements, 'clean')
+    @patch.object(Reimbursements, 'fetch')
+    def test_call_logs_timings(self, _fetch_mock, _clean_mock):
+        with self.assertLogs() as logs:
+            MultiYearReimbursements([2017, 2018], self.path)()
+        self.assertEqual(3, len(logs.output))
+        self.assertIn('2017: fetched in', logs.output[0])
+        self.assertIn('2018: fetched in', logs.output[1])
+        self.assertIn('Built 2 years', logs.output[2])
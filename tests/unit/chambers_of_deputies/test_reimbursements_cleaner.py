@@ -1,11 +1,14 @@
 import os.path
+import shutil
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import patch
+from zipfile import ZipFile
 
 import pandas as pd
 
 from serenata_toolbox.chamber_of_deputies.reimbursements_cleaner import \
-    COLUMNS, ReimbursementsCleaner
+    COLUMNS, InstallmentsBuffer, ReimbursementsCleaner
 
 FIXTURES_PATH = os.path.join('tests', 'fixtures', 'chamber_of_deputies')
 DATASET_COLS = [
@@ -43,7 +46,7 @@ DATASET_COLS = [
 
 class TestReimbursementsCleaner(TestCase):
     def setUp(self):
-        self.subject = ReimbursementsCleaner(2017, FIXTURES_PATH)
+        self.subject = ReimbursementsCleaner(2017, FIXTURES_PATH, chunksize=0)
 
     @patch.object(ReimbursementsCleaner, 'load_source_file')
     @patch.object(ReimbursementsCleaner, 'translate')
@@ -84,6 +87,18 @@ class TestReimbursementsCleaner(TestCase):
                          data.subquota_description.tolist())
         self.assertEqual(['1', '1', '3', '3', '3', '3'],
                          data.subquota_number.tolist())
+        self.assertEqual('category', data.subquota_description.dtype.name)
+
+    def test_translate_keeps_unknown_subquotas(self):
+        self.subject.data = pd.DataFrame({
+            'numSubCota': ['3', '42'],
+            'txtDescricao': ['COMBUSTÍVEIS E LUBRIFICANTES.', 'NOVA COTA'],
+        })
+        self.subject.translate()
+        self.assertEqual(['subquota_number', 'subquota_description'],
+                         list(self.subject.data.columns))
+        self.assertEqual(['Fuels and lubricants', 'NOVA COTA'],
+                         self.subject.data.subquota_description.tolist())
 
     def test_aggregate_multiple_payments_run_payments_functions(self):
         self.subject.load_source_file()
@@ -126,9 +141,174 @@ class TestReimbursementsCleaner(TestCase):
         ]
         self.assertEqual(values, data[cols].values.tolist())
 
+    def test_non_house_payments_aggregate_by_segments(self):
+        self.subject.data = pd.DataFrame({
+            'document_id': ['2', '1', '2', None, '1'],
+            'reimbursement_number': ['20', '10', '21', '30', '11'],
+            'net_value': [1.5, 2.0, float('nan'), 4.0, 3.0],
+            'reimbursement_value': [0, 1, 2, 3, 4],
+            'passenger': [None, 'Ana', 'Bia', 'Caio', None],
+        })
+        data = self.subject._non_house_payments()
+        self.assertEqual(
+            ['document_id', 'numbers', 'total_net_value', 'total_value', 'passenger'],
+            list(data.columns)
+        )
+        self.assertEqual([
+            ['1', ['10', '11'], 5.0, 5, 'Ana'],
+            ['2', ['20', '21'], 1.5, 2, 'Bia'],
+        ], data.values.tolist())
+
+    def test_non_house_payments_sum_as_pandas_does(self):
+        self.subject.data = pd.DataFrame({
+            'document_id': ['1'] * 10,
+            'reimbursement_number': [str(number) for number in range(1, 11)],
+            'net_value': [0.1] * 10,  # 0.9999999999999999 if summed naively
+            'reimbursement_value': [0.1] * 10,
+        })
+        expected = self.subject.data.groupby('document_id').net_value.sum()[0]
+        data = self.subject._non_house_payments()
+        self.assertEqual([expected], data.total_net_value.tolist())
+        self.assertEqual([1.0], data.total_value.tolist())
+
     def test_cleanup(self):
         expected_cols = set(COLUMNS.values())
         self.subject.load_source_file()
         self.subject.translate()
         self.subject.cleanup()
         self.assertEqual(expected_cols, set(self.subject.data.columns))
+
+
+class TestReimbursementsCleanerZip(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.subject = ReimbursementsCleaner(2017, self.directory.name, chunksize=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def zip(self, member):
+        with ZipFile(self.subject.zip_path, 'w') as archive:
+            archive.write(os.path.join(FIXTURES_PATH, 'Ano-2017.csv'), member)
+
+    def test_load_source_file_from_zip(self):
+        self.zip('Ano-2017.csv')
+        self.subject.load_source_file()
+        expected = ReimbursementsCleaner(2017, FIXTURES_PATH)
+        expected.load_source_file()
+        pd.testing.assert_frame_equal(expected.data, self.subject.data)
+        self.assertFalse(os.path.exists(self.subject.source_path))
+
+    def test_load_source_file_from_zip_with_another_name(self):
+        self.zip('cotas/ano-2017.csv')
+        self.subject.load_source_file()
+        self.assertEqual(6, len(self.subject.data))
+
+    def test_load_source_file_from_zip_without_csv(self):
+        with ZipFile(self.subject.zip_path, 'w') as archive:
+            archive.writestr('README.txt', 'Nothing here')
+        with self.assertRaises(ValueError):
+            self.subject.load_source_file()
+
+    def test_stream_from_zip(self):
+        self.zip('Ano-2017.csv')
+        self.subject.chunksize = 2
+        self.subject()
+        self.assertTrue(os.path.exists(self.subject.output_path))
+        self.assertFalse(os.path.exists(self.subject.source_path))
+
+
+class TestReimbursementsCleanerStream(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        for mode in ('whole', 'stream'):
+            path = os.path.join(self.directory.name, mode)
+            os.mkdir(path)
+            shutil.copy(os.path.join(FIXTURES_PATH, 'Ano-2017.csv'), path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def output(self, mode):
+        path = os.path.join(self.directory.name, mode, 'reimbursements-2017.csv')
+        with open(path) as fobj:
+            return fobj.read()
+
+    @patch.object(ReimbursementsCleaner, 'load_source_file')
+    @patch.object(ReimbursementsCleaner, 'stream')
+    def test_call_streams_with_a_chunksize(self, stream_mock, load_source_mock):
+        ReimbursementsCleaner(2017, FIXTURES_PATH, chunksize=2)()
+        stream_mock.assert_called_once_with()
+        load_source_mock.assert_not_called()
+
+    @patch('serenata_toolbox.chamber_of_deputies.reimbursements_cleaner.settings')
+    def test_stream_output_is_the_same_as_the_whole_file_one(self, settings):
+        settings.REIMBURSEMENTS_BUFFER_ROWS = 1  # spills every chunk
+        path = os.path.join(self.directory.name, 'whole')
+        ReimbursementsCleaner(2017, path, chunksize=0)()
+        path = os.path.join(self.directory.name, 'stream')
+        ReimbursementsCleaner(2017, path, chunksize=2)()
+        self.assertEqual(self.output('whole'), self.output('stream'))
+
+    def test_stream_output_with_values_inferred_differently_by_chunk(self):
+        for mode in ('whole', 'stream'):
+            path = os.path.join(self.directory.name, mode, 'Ano-2017.csv')
+            data = pd.read_csv(path, delimiter=';', dtype=str)
+            data.loc[5, 'vlrRestituicao'] = None  # only the last chunk has a blank
+            data.to_csv(path, sep=';', index=False)
+
+        path = os.path.join(self.directory.name, 'whole')
+        ReimbursementsCleaner(2017, path, chunksize=0)()
+        path = os.path.join(self.directory.name, 'stream')
+        ReimbursementsCleaner(2017, path, chunksize=2)()
+        self.assertEqual(self.output('whole'), self.output('stream'))
+
+    def test_whole_file_output_is_unchanged(self):
+        ReimbursementsCleaner(2017, os.path.join(self.directory.name, 'whole'), chunksize=0)()
+        with open(os.path.join(FIXTURES_PATH, 'cleaned-Ano-2017.csv')) as fobj:
+            self.assertEqual(fobj.read(), self.output('whole'))
+
+
+class TestInstallmentsBuffer(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.subject = InstallmentsBuffer(self.directory.name, max_rows=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def rows(self, *ids):
+        return pd.DataFrame({'document_id': list(ids), 'value': range(len(ids))})
+
+    def test_spills_to_disk_over_max_rows(self):
+        self.subject.add(self.rows('1', '2'))
+        self.assertEqual([], self.subject.spilled)
+        self.subject.add(self.rows('3'))
+        self.assertEqual(3, sum(count for _, count in self.subject.spilled))
+        self.assertEqual(([], 0), (self.subject.frames, self.subject.rows))
+
+    def test_partitions_without_spilling(self):
+        subject = InstallmentsBuffer(self.directory.name, max_rows=10)
+        subject.add(self.rows('2', '1', None))
+        subject.add(self.rows('1'))
+        partitions = list(subject.partitions())
+        self.assertEqual(1, len(partitions))
+        self.assertEqual(['2', '1', '1'], partitions[0]['document_id'].tolist())
+
+    def test_partitions_are_sorted_by_id_and_bounded(self):
+        subject = InstallmentsBuffer(self.directory.name, max_rows=50)
+        ids = [str(number) for number in range(1000)] * 2
+        for start in range(0, len(ids), 7):
+            subject.add(self.rows(*ids[start:start + 7]))
+
+        partitions = list(subject.partitions())
+        self.assertEqual(2000, sum(len(partition) for partition in partitions))
+        for previous, partition in zip(partitions, partitions[1:]):
+            self.assertLess(previous['document_id'].max(), partition['document_id'].min())
+        self.assertLessEqual(max(len(partition) for partition in partitions), 50)
+
+    def test_partitions_keep_the_order_of_each_document(self):
+        self.subject.add(self.rows('1', '2'))
+        self.subject.add(self.rows('1', '2', '1'))
+        rows = pd.concat(self.subject.partitions())
+        self.assertEqual([0, 0, 2], rows[rows['document_id'] == '1']['value'].tolist())
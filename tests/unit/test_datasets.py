@@ -1,7 +1,13 @@
+import asyncio
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from serenata_toolbox.datasets import Datasets, fetch, fetch_latest_backup
+from serenata_toolbox.datasets import Datasets, fetch, fetch_latest_backup, upload
+from serenata_toolbox.datasets.downloader import Downloader
+from serenata_toolbox.datasets.loader import LazyDataset
 
 
 class TestDatasets(TestCase):
@@ -20,6 +26,100 @@ class TestDatasets(TestCase):
         local.assert_called_once_with('test')
         downloader.assert_called_once_with('test', timeout=None)
 
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_init_with_downloader_arguments(self, downloader, local):
+        Datasets('test', materialize=True)
+        downloader.assert_called_once_with('test', timeout=None, materialize=True)
+
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_resolve_newest_local_file(self, downloader, local):
+        local.return_value.directory = os.path.abspath('test')
+        local.return_value.all = ('2016-12-15-speeches.xz', '2017-05-29-speeches.xz')
+        datasets = Datasets('test')
+        expected = os.path.join(os.path.abspath('test'), '2017-05-29-speeches.xz')
+        self.assertEqual(expected, datasets.resolve('speeches'))
+        self.assertFalse(downloader.return_value.download.called)
+
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_resolve_downloads_newest_remote_file(self, downloader, local):
+        local.return_value.directory = os.path.abspath('test')
+        local.return_value.all = ()
+        downloader.return_value.LATEST = Downloader.LATEST
+        datasets = Datasets('test')
+        expected = os.path.join(os.path.abspath('test'), '2017-05-29-speeches.xz')
+        self.assertEqual(expected, datasets.resolve('speeches'))
+        downloader.return_value.as_completed.assert_called_once_with('2017-05-29-speeches.xz')
+
+    def test_resolve_downloads_inside_a_running_event_loop(self):
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        datasets = Datasets(directory)
+
+        async def as_completed_async(downloader, files, order=None, client=None):
+            yield os.path.join(directory, files)
+
+        async def resolve():  # e.g. a Jupyter notebook
+            return datasets.resolve('speeches')
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with patch.object(Downloader, 'as_completed_async', as_completed_async):
+            path = loop.run_until_complete(resolve())
+        self.assertEqual(os.path.join(directory, '2017-05-29-speeches.xz'), path)
+
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_resolve_unknown_dataset(self, downloader, local):
+        local.return_value.all = ()
+        downloader.return_value.LATEST = Downloader.LATEST
+        with self.assertRaises(FileNotFoundError):
+            Datasets('test').resolve('unknown')
+
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_load_is_lazy(self, downloader, local):
+        datasets = Datasets('test')
+        datasets.resolve = Mock(return_value='2017-05-29-speeches.xz')
+        dataset = datasets.load('speeches', usecols=['speech'])
+        self.assertIsInstance(dataset, LazyDataset)
+        self.assertEqual({'usecols': ['speech']}, dataset.kwargs)
+        self.assertFalse(datasets.resolve.called)
+        self.assertEqual('2017-05-29-speeches.xz', dataset.path)
+        datasets.resolve.assert_called_once_with('speeches')
+
+    @patch('serenata_toolbox.datasets.chunks')
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_chunks(self, downloader, local, chunks):
+        datasets = Datasets('test')
+        datasets.resolve = Mock(return_value='2017-05-29-speeches.xz')
+        result = datasets.chunks('speeches', 42, columns=['speech'])
+        self.assertEqual(chunks.return_value, result)
+        chunks.assert_called_once_with('2017-05-29-speeches.xz', 42, columns=['speech'])
+
+    @patch('serenata_toolbox.datasets.memo')
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_load_is_memoized(self, downloader, local, memo):
+        datasets = Datasets('test')
+        datasets.resolve = Mock(return_value='2017-05-29-speeches.xz')
+        dataset = datasets.load('speeches', usecols=['speech'])
+        self.assertEqual(memo.read.return_value, dataset.frame)
+        memo.read.assert_called_once_with('2017-05-29-speeches.xz', usecols=['speech'])
+
+    @patch('serenata_toolbox.datasets.memo')
+    @patch('serenata_toolbox.datasets.read')
+    @patch('serenata_toolbox.datasets.LocalDatasets')
+    @patch('serenata_toolbox.datasets.Downloader')
+    def test_load_without_memo(self, downloader, local, read, memo):
+        datasets = Datasets('test')
+        datasets.resolve = Mock(return_value='2017-05-29-speeches.xz')
+        self.assertEqual(read.return_value, datasets.load('speeches', memoize=False).frame)
+        self.assertFalse(memo.read.called)
+
 
 class TestFetch(TestCase):
 
@@ -42,6 +142,15 @@ class TestFetch(TestCase):
         fetch_latest_backup('test')
         datasets.return_value.downloader.download.assert_called_once_with(('file1', 'file3'))
 
+    @patch('os.path.exists')
+    @patch('serenata_toolbox.datasets.Datasets')
+    def test_fetch_latest_backup_refreshes_corrupted_files(self, datasets, os_path_exists):
+        datasets().downloader.LATEST = ('file1', 'file2', 'file3')
+        datasets().downloader.manifest.is_intact.side_effect = [False, True, True]
+        os_path_exists.return_value = True
+        fetch_latest_backup('test')
+        datasets.return_value.downloader.download.assert_called_once_with(('file1',))
+
     @patch('os.path.exists')
     @patch('serenata_toolbox.datasets.Datasets')
     def test_fetch_latest_backup_with_force_all(self, datasets, os_path_exists):
@@ -49,3 +158,12 @@ class TestFetch(TestCase):
         os_path_exists.side_effect = [False, True, False]
         fetch_latest_backup('test', force_all=True)
         datasets.return_value.downloader.download.assert_called_once_with(('file1', 'file2', 'file3'))
+
+
+class TestUpload(TestCase):
+
+    @patch('serenata_toolbox.datasets.Uploader')
+    def test_upload(self, uploader):
+        upload('reimbursements-2017.csv', 'test')
+        uploader.assert_called_once_with('test')
+        uploader.return_value.upload.assert_called_once_with('reimbursements-2017.csv')
@@ -0,0 +1,117 @@
+import os
+import time
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import patch
+
+from serenata_toolbox.datasets.cache import CacheManager
+from serenata_toolbox.datasets.manifest import Manifest
+
+
+class TestCacheManager(TestCase):
+
+    DAY = 24 * 60 * 60
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.now = time.time()
+        self.write('2016-12-15-speeches.xz', 100, days_ago=10)
+        self.write('2016-12-15-speeches.feather', 100, days_ago=9)
+        self.write('2017-05-29-speeches.xz', 100, days_ago=8)
+        self.write('2016-11-19-current-year.xz', 100, days_ago=5)
+        self.write('2016-08-08-current-year.xz', 100, days_ago=1)
+        self.write('2018-01-05-reimbursements.xz', 100, days_ago=20)
+        self.write('.manifest.json', 100, days_ago=30)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def write(self, filename, size, days_ago):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'wb') as fobj:
+            fobj.write(b'0' * size)
+        used = self.now - days_ago * self.DAY
+        os.utime(path, (used, used))
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_disabled_by_default(self):
+        cache = CacheManager(self.directory)
+        self.assertFalse(cache.enabled)
+        self.assertEqual((), cache.evict())
+        self.assertEqual(7, len(self.files()))
+
+    def test_datasets_count_columnar_copy_with_its_source(self):
+        datasets = CacheManager(self.directory).datasets()
+        self.assertEqual(5, len(datasets))
+        size, used = datasets['2016-12-15-speeches.xz']
+        self.assertEqual(200, size)
+        self.assertAlmostEqual(self.now - 9 * self.DAY, used, places=2)
+
+    def test_usage(self):
+        self.assertEqual(600, CacheManager(self.directory).usage())
+
+    def test_evict_least_recently_used_first(self):
+        cache = CacheManager(self.directory, budget=400)
+        self.assertEqual(('2016-12-15-speeches.xz',), cache.evict())
+        self.assertNotIn('2016-12-15-speeches.feather', self.files())
+        self.assertEqual(400, cache.usage())
+
+    def test_evict_protects_newest_version_of_each_dataset(self):
+        cache = CacheManager(self.directory, budget=1)
+        expected = ('2016-12-15-speeches.xz', '2016-08-08-current-year.xz')
+        with patch('serenata_toolbox.datasets.cache.log') as log:
+            self.assertEqual(expected, cache.evict())
+        self.assertTrue(log.warning.called)
+        expected = [
+            '.manifest.json',
+            '2016-11-19-current-year.xz',
+            '2017-05-29-speeches.xz',
+            '2018-01-05-reimbursements.xz',
+        ]
+        self.assertEqual(expected, self.files())
+
+    def test_evict_protects_pinned_datasets(self):
+        cache = CacheManager(self.directory, budget=1, pinned=('speeches',))
+        self.assertEqual(('2016-08-08-current-year.xz',), cache.evict())
+
+    def test_evict_protects_pinned_files(self):
+        cache = CacheManager(self.directory, budget=1, pinned=('2016-08-08-current-year.xz',))
+        self.assertEqual(('2016-12-15-speeches.xz',), cache.evict())
+
+    def test_evict_protects_kept_files(self):
+        cache = CacheManager(self.directory, budget=1)
+        self.assertEqual(
+            ('2016-08-08-current-year.xz',),
+            cache.evict(keep=('2016-12-15-speeches.xz',)),
+        )
+
+    def test_evict_records_evicted_datasets_in_the_manifest(self):
+        cache = CacheManager(self.directory, budget=400)
+        cache.evict()
+        manifest = Manifest(self.directory)
+        self.assertTrue(manifest.is_evicted('2016-12-15-speeches.xz'))
+        self.assertFalse(manifest.is_evicted('2017-05-29-speeches.xz'))
+
+        manifest.update('2016-12-15-speeches.xz', {})  # downloaded again
+        self.assertFalse(manifest.is_evicted('2016-12-15-speeches.xz'))
+
+    def test_evict_by_age(self):
+        cache = CacheManager(self.directory, max_age=7)
+        self.assertEqual(('2016-12-15-speeches.xz',), cache.evict())
+
+    def test_evict_orphan_columnar_copies(self):
+        self.write('2016-12-22-agreements.feather', 100, days_ago=2)
+        cache = CacheManager(self.directory, max_age=1.5)
+        self.assertIn('2016-12-22-agreements.feather', cache.evict())
+        self.assertNotIn('2016-12-22-agreements.feather', self.files())
+
+    @patch('serenata_toolbox.datasets.cache.settings')
+    def test_settings(self, settings):
+        settings.DATA_BUDGET = 42
+        settings.DATA_MAX_AGE = 7
+        settings.DATA_PINNED = ['speeches']
+        cache = CacheManager(self.directory)
+        self.assertEqual((42, 7, {'speeches'}), (cache.budget, cache.max_age, cache.pinned))
@@ -0,0 +1,136 @@
+import json
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+
+from serenata_toolbox.datasets.catalog import Catalog, is_bookkeeping, parse_filename
+
+
+class TestCatalogHelpers(TestCase):
+
+    def test_parse_filename(self):
+        self.assertEqual(('presences', '2017-05-29'), parse_filename('2017-05-29-presences.xz'))
+        self.assertEqual(('brazilian-cities', '2017-05-22'),
+                         parse_filename('2017-05-22-brazilian-cities.csv'))
+        self.assertEqual(('reimbursements-2017', None), parse_filename('reimbursements-2017.csv'))
+
+    def test_is_bookkeeping(self):
+        bookkeeping = (
+            'a.xz.part',
+            'a.xz.part.json',
+            '.manifest.json',
+            '.catalog.json',
+            '.manifest.json.tmp',
+            '2017-05-29-presences.feather',
+            '2017-05-29-presences.feather.0.tmp',
+        )
+        for filename in bookkeeping:
+            self.assertTrue(is_bookkeeping(filename))
+        self.assertFalse(is_bookkeeping('2017-05-29-presences.xz'))
+
+
+class TestCatalog(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.catalog = Catalog(self.directory)
+        self.reimbursements = pd.DataFrame({
+            'document_id': [1, 2, 3],
+            'issue_date': ['2017-01-02', '2017-03-04', 'not a date'],
+            'supplier': ['a', 'b', 'c'],
+        })
+        self.write('2018-01-05-reimbursements.xz', self.reimbursements)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def write(self, filename, df):
+        df.to_csv(self.path(filename), compression='infer', encoding='utf-8', index=False)
+
+    def test_refresh(self):
+        entries = self.catalog.refresh()
+        expected = {
+            'name': 'reimbursements',
+            'date': '2018-01-05',
+            'size': os.path.getsize(self.path('2018-01-05-reimbursements.xz')),
+            'mtime': os.path.getmtime(self.path('2018-01-05-reimbursements.xz')),
+            'columnar_size': None,
+            'rows': 3,
+            'columns': {'document_id': 'int64', 'issue_date': 'object', 'supplier': 'object'},
+            'date_range': {'issue_date': ['2017-01-02T00:00:00', '2017-03-04T00:00:00']},
+        }
+        self.assertEqual({'2018-01-05-reimbursements.xz': expected}, entries)
+
+    def test_refresh_saves_catalog_next_to_the_data(self):
+        self.catalog.refresh()
+        with open(self.path('.catalog.json')) as fobj:
+            self.assertEqual(self.catalog.entries, json.load(fobj))
+        self.assertEqual(self.catalog.entries, Catalog(self.directory).entries)
+
+    def test_refresh_in_chunks(self):
+        df = pd.DataFrame({'value': range(5), 'date': pd.date_range('2017-01-01', periods=5)})
+        df.loc[3, 'value'] = None
+        self.write('values.csv', df)
+        with patch('serenata_toolbox.datasets.catalog.CHUNK_SIZE', 2):
+            entry = self.catalog.refresh()['values.csv']
+        self.assertEqual(5, entry['rows'])
+        self.assertEqual('float64', entry['columns']['value'])
+        self.assertEqual(['2017-01-01T00:00:00', '2017-01-05T00:00:00'], entry['date_range']['date'])
+
+    def test_refresh_inspects_only_changed_files(self):
+        self.catalog.refresh()
+        self.write('2018-01-05-companies.xz', pd.DataFrame({'cnpj': ['42']}))
+        with patch.object(Catalog, 'inspect', wraps=Catalog.inspect) as inspect:
+            entries = self.catalog.refresh()
+        inspect.assert_called_once_with(self.path('2018-01-05-companies.xz'))
+        self.assertEqual(2, len(entries))
+
+        os.utime(self.path('2018-01-05-companies.xz'), (0, 0))
+        with patch.object(Catalog, 'inspect', wraps=Catalog.inspect) as inspect:
+            self.catalog.refresh()
+        inspect.assert_called_once_with(self.path('2018-01-05-companies.xz'))
+
+    def test_refresh_forgets_deleted_files(self):
+        self.catalog.refresh()
+        os.remove(self.path('2018-01-05-reimbursements.xz'))
+        self.assertEqual({}, self.catalog.refresh())
+        self.assertEqual({}, Catalog(self.directory).entries)
+
+    def test_refresh_skips_bookkeeping_files_and_directories(self):
+        os.mkdir(self.path('backup'))
+        for filename in ('a.xz.part', 'a.xz.part.json', '.manifest.json', '.manifest.json.tmp', 'a.feather.0.tmp'):
+            open(self.path(filename), 'w').close()
+        self.assertEqual(['2018-01-05-reimbursements.xz'], list(self.catalog.refresh()))
+
+    def test_refresh_records_the_size_of_columnar_copies_in_their_source(self):
+        self.catalog.refresh()
+        with open(self.path('2018-01-05-reimbursements.feather'), 'wb') as fobj:
+            fobj.write(b'42')
+        entries = self.catalog.refresh()
+        self.assertEqual(['2018-01-05-reimbursements.xz'], list(entries))
+        self.assertEqual(2, entries['2018-01-05-reimbursements.xz']['columnar_size'])
+        self.assertEqual(entries, Catalog(self.directory).entries)
+
+        os.remove(self.path('2018-01-05-reimbursements.feather'))
+        self.assertIsNone(self.catalog.refresh()['2018-01-05-reimbursements.xz']['columnar_size'])
+
+    def test_refresh_describes_other_files_without_inspecting_them(self):
+        open(self.path('2018-01-05-reimbursements.pdf'), 'wb').close()
+        entry = self.catalog.refresh()['2018-01-05-reimbursements.pdf']
+        self.assertEqual('reimbursements.pdf', entry['name'])
+        self.assertIsNone(entry['rows'])
+
+    @patch('serenata_toolbox.datasets.catalog.log')
+    def test_refresh_logs_files_that_are_not_csv(self, log):
+        with open(self.path('broken.xz'), 'wb') as fobj:
+            fobj.write(b'not xz at all')
+        entry = self.catalog.refresh()['broken.xz']
+        self.assertIsNone(entry['rows'])
+        self.assertTrue(log.error.called)
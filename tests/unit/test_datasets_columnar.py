@@ -0,0 +1,281 @@
+import asyncio
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Event
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from serenata_toolbox.datasets.columnar import (
+    Aborted,
+    ColumnarWriter,
+    QueueReader,
+    StreamingConverter,
+    columnar_path,
+    convert,
+    load,
+    read_columnar,
+    read_csv,
+    write_columnar,
+)
+
+
+class TestColumnar(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, '2017-05-29-presences.xz')
+        self.data = pd.DataFrame({'congressperson_name': ['Ana', 'Bia'], 'present': [True, False]})
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_columnar_path(self):
+        expected = os.path.join(self.directory, '2017-05-29-presences.feather')
+        self.assertEqual(expected, columnar_path(self.path))
+
+    def test_write_columnar(self):
+        path = write_columnar(self.data, self.path)
+        self.assertEqual(columnar_path(self.path), path)
+        pd.testing.assert_frame_equal(self.data, pd.read_feather(path))
+        self.assertEqual({'2017-05-29-presences.feather'}, set(os.listdir(self.directory)))
+
+    def test_convert(self):
+        self.data.to_csv(self.path, compression='xz', index=False)
+        convert(self.path)
+        pd.testing.assert_frame_equal(self.data, pd.read_feather(columnar_path(self.path)))
+
+    @patch('serenata_toolbox.datasets.columnar.CHUNK_ROWS', 1)
+    def test_convert_in_chunks(self):
+        self.data['votes'] = [42, None]  # integers, then a blank
+        self.data['party'] = ['PT', 'A1']  # text, unless in the first chunk
+        self.data.loc[0, 'party'] = '13'
+        self.data.to_csv(self.path, compression='xz', index=False)
+        convert(self.path)
+        expected = read_csv(self.path)
+        pd.testing.assert_frame_equal(expected, pd.read_feather(columnar_path(self.path)))
+        self.assertEqual({'2017-05-29-presences.xz', '2017-05-29-presences.feather'},
+                         set(os.listdir(self.directory)))
+
+    @patch('serenata_toolbox.datasets.columnar.log')
+    def test_convert_logs_errors(self, log):
+        with open(self.path, 'wb') as fobj:
+            fobj.write(b'not xz')
+        self.assertIsNone(convert(self.path))
+        self.assertTrue(log.error.called)
+        self.assertFalse(os.path.exists(columnar_path(self.path)))
+
+
+class TestColumnarCache(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, '2017-05-29-presences.xz')
+        self.data = pd.DataFrame({'congressperson_name': ['Ana', 'Bia'], 'present': [True, False]})
+        self.data.to_csv(self.path, compression='xz', index=False)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_read_columnar_without_copy(self):
+        self.assertIsNone(read_columnar(self.path))
+
+    def test_read_columnar(self):
+        write_columnar(self.data, self.path)
+        table = read_columnar(self.path, columns=['present'])
+        self.assertEqual(['present'], table.column_names)
+        self.assertEqual([True, False], table.column('present').to_pylist())
+
+    def test_read_columnar_ignores_stale_copy(self):
+        write_columnar(self.data, self.path)
+        os.utime(self.path, (0, 0))
+        self.assertIsNone(read_columnar(self.path))
+
+    def test_read_columnar_ignores_copy_of_unknown_version(self):
+        self.data.to_feather(columnar_path(self.path))
+        self.assertIsNone(read_columnar(self.path))
+
+    @patch('serenata_toolbox.datasets.columnar.write_columnar')
+    @patch('serenata_toolbox.datasets.columnar.log')
+    def test_read_columnar_unknown_columns(self, log, write):
+        write_columnar(self.data, self.path)
+        with self.assertRaises(KeyError):
+            read_columnar(self.path, columns=['presnet'])
+        with self.assertRaises(KeyError):
+            load(self.path, columns=['presnet'])
+        self.assertFalse(log.error.called)
+        self.assertFalse(write.called)  # the copy is fine, it's not rebuilt
+
+    @patch('serenata_toolbox.datasets.columnar.log')
+    def test_read_columnar_ignores_broken_copy(self, log):
+        with open(columnar_path(self.path), 'wb') as fobj:
+            fobj.write(b'not feather')
+        self.assertIsNone(read_columnar(self.path))
+        self.assertTrue(log.error.called)
+
+    def test_load_creates_copy_on_first_read(self):
+        pd.testing.assert_frame_equal(self.data, load(self.path))
+        self.assertIsNotNone(read_columnar(self.path))
+
+        with patch('serenata_toolbox.datasets.columnar.pd.read_csv') as read_csv:
+            pd.testing.assert_frame_equal(self.data, load(self.path))
+        self.assertFalse(read_csv.called)
+
+    def test_load_refreshes_stale_copy(self):
+        load(self.path)
+        self.data['present'] = [False, False]
+        self.data.to_csv(self.path, compression='xz', index=False)
+        os.utime(self.path, (0, 0))
+        pd.testing.assert_frame_equal(self.data, load(self.path))
+        pd.testing.assert_frame_equal(self.data, load(self.path))
+
+    def test_load_columns_and_dtype(self):
+        load(self.path)
+        df = load(self.path, ['present'], {'present': 'category'})
+        self.assertEqual(['present'], list(df.columns))
+        self.assertEqual('category', df.present.dtype.name)
+
+    def test_load_never_reads_strings_from_numbers(self):
+        path = os.path.join(self.directory, 'numbers.csv')
+        pd.DataFrame({'cnpj': ['0042']}).to_csv(path, index=False)
+        write_columnar(pd.DataFrame({'cnpj': [42]}), path)  # parsed as numbers
+        self.assertIsNotNone(read_columnar(path))
+        self.assertIsNone(load(path, dtype={'cnpj': str}))
+        self.assertEqual(42, load(path, dtype={'cnpj': float}).cnpj[0])
+
+    def test_load_parses_with_dtypes_preset(self):
+        path = os.path.join(self.directory, '2016-09-03-companies.xz')
+        pd.DataFrame({'cnpj': ['0042']}).to_csv(path, compression='xz', index=False)
+        load(path)
+        self.assertEqual('0042', load(path, dtype={'cnpj': str}).cnpj[0])
+
+    @patch('serenata_toolbox.datasets.columnar.feather', None)
+    @patch('serenata_toolbox.datasets.columnar.pa', None)
+    def test_load_without_pyarrow(self):
+        self.assertIsNone(load(self.path))
+        self.assertFalse(os.path.exists(columnar_path(self.path)))
+
+
+class TestStreamingConverter(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.loop.set_default_executor(self.executor)
+        self.data = pd.DataFrame({'name': ['Ana', 'Bia'] * 500, 'value': range(1000)})
+
+    def tearDown(self):
+        self.loop.close()
+        rmtree(self.directory)
+
+    async def convert(self, filename, contents):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'wb') as fobj:
+            fobj.write(contents)
+
+        converter = StreamingConverter(path)
+        for start in range(0, len(contents), 16):  # more chunks than the queue holds
+            await converter.feed(contents[start:start + 16])
+        return await converter.close()
+
+    def test_converters_do_not_depend_on_the_default_executor(self):
+        busy = Event()
+        self.loop.run_in_executor(None, busy.wait)  # takes its only thread
+        contents = lzma.compress(self.data.to_csv(index=False).encode())
+        filenames = [f'2017-05-29-dataset-{number}.xz' for number in range(3)]
+
+        async def convert_all():
+            converting = (self.convert(name, contents) for name in filenames)
+            return await asyncio.wait_for(asyncio.gather(*converting), 10)
+
+        try:
+            paths = self.loop.run_until_complete(convert_all())
+        finally:
+            busy.set()
+
+        for path in paths:
+            pd.testing.assert_frame_equal(self.data, pd.read_feather(path))
+
+
+    def assertSameCopy(self, path):
+        expected = read_csv(path)
+        pd.testing.assert_frame_equal(expected, pd.read_feather(columnar_path(path)))
+        pd.testing.assert_frame_equal(expected, load(path))
+        self.assertEqual({os.path.basename(path), os.path.basename(columnar_path(path))},
+                         set(os.listdir(self.directory)))
+
+    @patch('serenata_toolbox.datasets.columnar.CHUNK_ROWS', 3)
+    def test_converter_writes_chunks_as_they_are_parsed(self):
+        data = pd.DataFrame({
+            'document_id': [1, 2, 3, 4, None, 6, 7],  # a nullable integer
+            'state': ['SP', 'RJ', 'SP', 'MG', None, 'AC', 'SP'],  # a category
+            'month': [1, 2, 3, 4, 5, 6, 7],
+            'batch': [1, 2, 3, 4, None, 6, 7],  # floats only in the second chunk
+            'passenger': [None, None, None, 'Ana', 'Bia', None, 'Ana'],
+            'refund': [True, False, True, None, True, True, False],
+        })
+        contents = lzma.compress(data.to_csv(index=False).encode())
+        with patch.object(ColumnarWriter, 'add', side_effect=ColumnarWriter.add,
+                          autospec=True) as add:
+            path = self.loop.run_until_complete(
+                self.convert('2018-01-05-reimbursements.xz', contents)
+            )
+
+        self.assertEqual(3, add.call_count)
+        source = os.path.join(self.directory, '2018-01-05-reimbursements.xz')
+        self.assertEqual(columnar_path(source), path)
+        self.assertSameCopy(source)
+
+    @patch('serenata_toolbox.datasets.columnar.CHUNK_ROWS', 3)
+    def test_converter_parses_the_whole_file_when_chunks_disagree(self):
+        data = pd.DataFrame({'code': ['1', '2', '3', 'A4', '5']})  # numbers, then text
+        contents = lzma.compress(data.to_csv(index=False).encode())
+        self.loop.run_until_complete(self.convert('2017-05-29-codes.xz', contents))
+        self.assertSameCopy(os.path.join(self.directory, '2017-05-29-codes.xz'))
+
+    @patch('serenata_toolbox.datasets.columnar.CHUNK_ROWS', 10 ** 3)
+    def test_abort_removes_temporary_files(self):
+        data = pd.DataFrame({'value': np.random.rand(2 * 10 ** 4)})  # many chunks
+        contents = lzma.compress(data.to_csv(index=False).encode())
+        path = os.path.join(self.directory, '2017-05-29-dataset.xz')
+
+        async def abort():
+            converter = StreamingConverter(path)
+            await converter.feed(contents)
+            while not os.listdir(self.directory):  # some chunks are written
+                await asyncio.sleep(0.01)
+            converter.abort()
+            await converter.future
+
+        with self.assertRaises(Aborted):
+            self.loop.run_until_complete(abort())
+        self.assertEqual([], os.listdir(self.directory))
+
+
+class TestQueueReader(TestCase):
+
+    def reader(self, *chunks):
+        queue = Queue()
+        for chunk in chunks:
+            queue.put(chunk)
+        return QueueReader(queue)
+
+    def test_read(self):
+        reader = self.reader(b'serenata', b' de ', b'amor', None)
+        self.assertEqual(b'sere', reader.read(4))
+        self.assertEqual(b'nata de a', reader.read(9))
+        self.assertEqual(b'mor', reader.read())
+        self.assertEqual(b'', reader.read(4))
+
+    def test_read_raises_errors_put_in_the_queue(self):
+        reader = self.reader(b'serenata', ValueError())
+        self.assertEqual(b'se', reader.read(2))
+        with self.assertRaises(ValueError):
+            reader.read()
@@ -0,0 +1,86 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from serenata_toolbox.datasets.concurrency import AdaptiveSemaphore
+
+
+class TestAdaptiveSemaphore(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.clock = patch('serenata_toolbox.datasets.concurrency.monotonic')
+        self.monotonic = self.clock.start()
+        self.monotonic.return_value = 0
+
+        async def semaphore():  # created within the loop, as the Downloader does
+            return AdaptiveSemaphore(8, window=1)
+
+        self.semaphore = self.loop.run_until_complete(semaphore())
+
+    def tearDown(self):
+        self.clock.stop()
+        self.loop.close()
+
+    def measure(self, size, elapsed=1):
+        async def record():
+            self.monotonic.return_value += elapsed
+            self.semaphore.record(size)
+
+        self.loop.run_until_complete(record())
+
+    def test_starts_with_two_requests(self):
+        self.assertEqual(2, self.semaphore.limit)
+
+    def test_grows_while_throughput_improves(self):
+        for throughput in (10, 20, 30):
+            self.measure(throughput)
+        self.assertEqual(5, self.semaphore.limit)
+
+    def test_does_not_grow_beyond_maximum(self):
+        for throughput in range(1, 42):
+            self.measure(throughput * 10)
+        self.assertEqual(8, self.semaphore.limit)
+
+    def test_keeps_limit_when_throughput_is_stable(self):
+        self.measure(10)
+        self.measure(10)
+        self.assertEqual(3, self.semaphore.limit)
+
+    def test_shrinks_when_throughput_drops(self):
+        self.measure(10)
+        self.measure(5)
+        self.assertEqual(2, self.semaphore.limit)
+
+    def test_waits_for_window_before_measuring(self):
+        self.measure(10, elapsed=0.5)
+        self.assertEqual(2, self.semaphore.limit)
+
+    def test_halves_on_errors(self):
+        self.semaphore.limit = 8
+
+        async def fail():
+            async with self.semaphore:
+                raise ValueError()
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(fail())
+        self.assertEqual(4, self.semaphore.limit)
+        self.assertEqual(0, self.semaphore.active)
+
+    def test_limits_concurrent_requests(self):
+        running, peak = 0, 0
+
+        async def request():
+            nonlocal running, peak
+            async with self.semaphore:
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def requests():
+            await asyncio.gather(*(request() for _ in range(6)))
+
+        self.loop.run_until_complete(requests())
+        self.assertEqual(2, peak)
@@ -1,11 +1,30 @@
 import asyncio
+import json
 import os
 from concurrent.futures import TimeoutError
+from hashlib import md5, sha256
+from shutil import rmtree
+from tempfile import NamedTemporaryFile, mkdtemp
 from unittest import TestCase
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
-from aiohttp import ClientSession
-from serenata_toolbox.datasets.downloader import Downloader
+import pandas as pd
+from aiohttp import ClientPayloadError, ClientSession, web
+from aiohttp.test_utils import TestServer
+from serenata_toolbox import settings
+from serenata_toolbox.datasets.cache import CacheManager
+from serenata_toolbox.datasets.columnar import read_columnar
+from serenata_toolbox.datasets.concurrency import AdaptiveSemaphore
+from serenata_toolbox.datasets.downloader import (
+    Batch,
+    ChecksumMismatch,
+    MAX_REQUESTS,
+    Downloader,
+    RemoteFileNotFound,
+    RetriesExhausted,
+    ServerError,
+)
+from serenata_toolbox.datasets.manifest import Manifest
 
 
 class TestDownloader(TestCase):
@@ -17,8 +36,24 @@ class TestDownloader(TestCase):
         isdir.return_value = True
         downloader = Downloader('test', timeout=1)
         self.assertEqual(os.path.abspath('test'), downloader.target)
-        self.assertEqual(0, downloader.total)
         self.assertEqual(1, downloader.timeout)
+        self.assertEqual(settings.DOWNLOAD_MAX_REQUESTS, downloader.max_requests)
+        self.assertEqual(MAX_REQUESTS, downloader.max_requests)
+        self.assertFalse(downloader.adaptive)
+
+    @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
+    @patch('serenata_toolbox.datasets.downloader.os.path.exists')
+    def test_init_adaptive(self, exists, isdir):
+        downloader = Downloader('test', max_requests=16, adaptive=True)
+
+        async def semaphore():
+            return downloader.semaphore
+
+        loop = asyncio.new_event_loop()
+        semaphore = loop.run_until_complete(semaphore())
+        loop.close()
+        self.assertIsInstance(semaphore, AdaptiveSemaphore)
+        self.assertEqual(16, semaphore.maximum)
 
     @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
     @patch('serenata_toolbox.datasets.downloader.os.path.exists')
@@ -51,11 +86,11 @@ class TestDownloader(TestCase):
         self.assertIsNone(downloader.download(''))
         self.assertIsNone(downloader.download([]))
 
-    @patch.object(Downloader, 'main')
+    @patch.object(Downloader, 'download_async')
     @patch('serenata_toolbox.datasets.downloader.asyncio')
     @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
     @patch('serenata_toolbox.datasets.downloader.os.path.exists')
-    def test_download_single_file(self, exists, isdir, asyncio_, main):
+    def test_download_wraps_download_async(self, exists, isdir, asyncio_, download_async):
         exists.return_value = True
         isdir.return_value = True
         downloader = Downloader('test')
@@ -63,21 +98,63 @@ class TestDownloader(TestCase):
         asyncio_.get_event_loop.assert_called_with()
         loop = asyncio_.get_event_loop.return_value
         self.assertTrue(loop.run_until_complete.called)
-        main.assert_called_once_with(loop, ('test.xz',))
+        download_async.assert_called_once_with('test.xz')
 
     @patch.object(Downloader, 'main')
-    @patch('serenata_toolbox.datasets.downloader.asyncio')
     @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
     @patch('serenata_toolbox.datasets.downloader.os.path.exists')
-    def test_download_multiple_files(self, exists, isdir, asyncio_, main):
+    def test_download_async_single_file(self, exists, isdir, main):
         exists.return_value = True
         isdir.return_value = True
         downloader = Downloader('test')
-        downloader.download(range(3))
-        asyncio_.get_event_loop.assert_called_with()
-        loop = asyncio_.get_event_loop.return_value
-        self.assertTrue(loop.run_until_complete.called)
-        main.assert_called_once_with(loop, (1, 2))
+        loop = asyncio.new_event_loop()
+        paths = loop.run_until_complete(downloader.download_async('test.xz'))
+        loop.close()
+        main.assert_called_once_with(('test.xz',), None, None)
+        self.assertEqual((os.path.join(downloader.target, 'test.xz'),), paths)
+
+    @patch.object(Downloader, 'main')
+    @patch('serenata_toolbox.datasets.downloader.CacheManager')
+    @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
+    @patch('serenata_toolbox.datasets.downloader.os.path.exists')
+    def test_download_async_evicts_old_datasets(self, exists, isdir, cache, main):
+        downloader = Downloader('test', budget=42, pinned=('speeches',))
+        cache.assert_called_once_with(
+            downloader.target, 42, None, ('speeches',), downloader.manifest
+        )
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(downloader.download_async(['a.xz', 'b.xz']))
+        loop.close()
+        cache.return_value.evict.assert_called_once_with(keep=('a.xz', 'b.xz'))
+
+    @patch.object(Downloader, 'main')
+    @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
+    @patch('serenata_toolbox.datasets.downloader.os.path.exists')
+    def test_download_async_multiple_files(self, exists, isdir, main):
+        exists.return_value = True
+        isdir.return_value = True
+        downloader = Downloader('test')
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(downloader.download_async(['a.xz', '', 'b.xz']))
+        loop.close()
+        main.assert_called_once_with(('a.xz', 'b.xz'), None, None)
+
+    @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
+    @patch('serenata_toolbox.datasets.downloader.os.path.exists')
+    def test_semaphore_is_created_per_event_loop(self, exists, isdir):
+        downloader = Downloader('test')
+
+        async def semaphore():
+            return downloader.semaphore
+
+        loops = asyncio.new_event_loop(), asyncio.new_event_loop()
+        first, again = (loops[0].run_until_complete(semaphore()) for _ in range(2))
+        other = loops[1].run_until_complete(semaphore())
+        for loop in loops:
+            loop.close()
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
 
     @patch('serenata_toolbox.datasets.downloader.os.path.isdir')
     @patch('serenata_toolbox.datasets.downloader.os.path.exists')
@@ -99,4 +176,711 @@ class TestDownloader(TestCase):
             loop = asyncio.get_event_loop()
 
             with ClientSession(loop=loop) as client:
-                yield from downloader.fetch_file(client, '2016-12-06-reibursements.xz')
+                yield from downloader.fetch_file(client, '2016-12-06-reibursements.xz', Batch())
+
+
+class FakeBucket:
+    """Serves in-memory objects over HTTP the way our S3-compatible bucket does."""
+
+    LAST_MODIFIED = 'Fri, 05 Jan 2018 00:00:00 GMT'
+
+    def __init__(self, loop, objects):
+        self.objects = objects
+        self.requests = []
+        self.interrupt_after = None  # bytes sent before dropping connections
+        self.ignore_range = False
+        self.checksums = {}  # published as object metadata
+        self.failures = {}  # statuses returned before serving each key
+        self.range_failures = {}  # statuses returned before serving each range
+        self.page_size = 1000
+
+        app = web.Application()
+        app.router.add_route('*', '/{bucket}/{key:.*}', self.handle)
+        self.server = TestServer(app, loop=loop)
+        loop.run_until_complete(self.server.start_server())
+
+    def url(self, key):
+        return str(self.server.make_url(f'/{settings.AMAZON_BUCKET}/{key}'))
+
+    @staticmethod
+    def etag(contents):
+        return '"{}"'.format(md5(contents).hexdigest())
+
+    async def handle(self, request):
+        self.requests.append(request)
+        key = request.match_info['key']
+        if not key and request.query.get('list-type') == '2':
+            return self.listing(request)
+        if key not in self.objects:
+            return web.Response(status=404)
+
+        if self.failures.get(key):
+            return web.Response(status=self.failures[key].pop(0))
+
+        contents = self.objects[key]
+        headers = {'ETag': self.etag(contents), 'Last-Modified': self.LAST_MODIFIED}
+        if key in self.checksums:
+            headers['x-amz-meta-sha256'] = self.checksums[key]
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            return web.Response(status=304, headers=headers)
+
+        if request.method == 'HEAD':
+            headers['Content-Length'] = str(len(contents))
+            return web.Response(headers=headers)
+
+        range_ = request.headers.get('Range')
+        if self.range_failures.get(range_):
+            return web.Response(status=self.range_failures[range_].pop(0))
+
+        if_range = request.headers.get('If-Range')
+        if range_ and if_range in (None, headers['ETag']) and not self.ignore_range:
+            start, end = range_[len('bytes='):].split('-')
+            start, end = int(start), int(end or len(contents) - 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(contents)}'
+            return web.Response(status=206, body=contents[start:end + 1], headers=headers)
+
+        if self.interrupt_after is not None:
+            return await self.interrupt(request, contents, headers)
+
+        return web.Response(body=contents, headers=headers)
+
+    def listing(self, request):
+        prefix = request.query.get('prefix', '')
+        keys = sorted(key for key in self.objects if key.startswith(prefix))
+        start = int(request.query.get('continuation-token', 0))
+        end = start + self.page_size
+        contents = ''.join(
+            '<Contents><Key>{}</Key><LastModified>2018-01-05T00:00:00.000Z'
+            '</LastModified><ETag>{}</ETag><Size>{}</Size></Contents>'.format(
+                key,
+                self.etag(self.objects[key]).replace('"', '&quot;'),
+                len(self.objects[key]),
+            )
+            for key in keys[start:end]
+        )
+        truncated = end < len(keys)
+        token = f'<NextContinuationToken>{end}</NextContinuationToken>' if truncated else ''
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f'<Prefix>{prefix}</Prefix><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+            f'{token}{contents}</ListBucketResult>'
+        )
+        return web.Response(body=body.encode(), content_type='application/xml')
+
+    async def interrupt(self, request, contents, headers):
+        response = web.StreamResponse(headers=headers)
+        response.content_length = len(contents)
+        await response.prepare(request)
+        await response.write(contents[:self.interrupt_after])
+        await asyncio.sleep(0.1)  # let the client read what was sent
+        request.transport.close()
+        return response
+
+
+class HTTPTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.target = mkdtemp()
+        self.bucket = FakeBucket(self.loop, {'test.xz': self.CONTENTS})
+        self.downloader = Downloader(self.target, chunk_size=2 ** 16)
+        self.downloader.url = self.bucket.url
+        self.batch = Batch()
+        self.batch.progress = MagicMock()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.bucket.server.close())
+        self.loop.close()
+        rmtree(self.target)
+
+    def fetch_file(self, filename):
+        async def fetch():
+            async with ClientSession() as client:
+                await self.downloader.fetch_file(client, filename, self.batch)
+
+        self.loop.run_until_complete(fetch())
+
+    def path(self, filename):
+        return os.path.join(self.target, filename)
+
+    def read(self, filename):
+        with open(self.path(filename), 'rb') as fobj:
+            return fobj.read()
+
+    def write_partial(self, filename, contents, etag):
+        with open(self.path(filename + '.part'), 'wb') as fobj:
+            fobj.write(contents)
+        with open(self.path(filename + '.part.json'), 'w') as fobj:
+            json.dump({'size': len(self.CONTENTS), 'etag': etag}, fobj)
+
+    def progress(self):
+        return [args[0] for args, _ in self.batch.progress.update.call_args_list]
+
+
+class TestDownloaderOverHTTP(HTTPTestCase):
+
+    CONTENTS = os.urandom(2 ** 18 + 42)
+
+    def test_fetch_file_writes_chunks_as_they_arrive(self):
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS), sum(self.progress()))
+        self.assertTrue(all(update <= 2 ** 16 for update in self.progress()))
+        self.assertEqual(['.manifest.json', 'test.xz'], sorted(os.listdir(self.target)))
+
+    def test_fetch_file_resumes_partial_download(self):
+        etag = FakeBucket.etag(self.CONTENTS)
+        self.write_partial('test.xz', self.CONTENTS[:1000], etag)
+        self.fetch_file('test.xz')
+
+        request, *_ = self.bucket.requests
+        self.assertEqual('bytes=1000-', request.headers['Range'])
+        self.assertEqual(etag, request.headers['If-Range'])
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS), sum(self.progress()))
+        self.assertEqual(['.manifest.json', 'test.xz'], sorted(os.listdir(self.target)))
+
+    def test_fetch_file_restarts_when_remote_file_changed(self):
+        self.write_partial('test.xz', b'outdated contents', '"outdated"')
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS), sum(self.progress()))
+
+    def test_fetch_file_keeps_partial_download_on_failure(self):
+        self.bucket.interrupt_after = 2 ** 17
+        with self.assertRaises(ClientPayloadError):
+            self.fetch_file('test.xz')
+
+        self.assertFalse(os.path.exists(self.path('test.xz')))
+        self.assertEqual(self.CONTENTS[:2 ** 17], self.read('test.xz.part'))
+        with open(self.path('test.xz.part.json')) as fobj:
+            expected = {'size': len(self.CONTENTS), 'etag': FakeBucket.etag(self.CONTENTS)}
+            self.assertEqual(expected, json.load(fobj))
+
+        self.bucket.interrupt_after = None
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual('bytes=131072-', self.bucket.requests[-1].headers['Range'])
+
+    def test_fetch_file_records_validators_in_manifest(self):
+        self.fetch_file('test.xz')
+        expected = {
+            'etag': FakeBucket.etag(self.CONTENTS),
+            'last_modified': FakeBucket.LAST_MODIFIED,
+            'sha256': sha256(self.CONTENTS).hexdigest(),
+            'size': len(self.CONTENTS),
+        }
+        self.assertEqual(expected, self.downloader.manifest.get('test.xz'))
+        self.assertEqual(expected, Manifest(self.target).get('test.xz'))
+
+    def test_fetch_file_skips_unchanged_file(self):
+        self.fetch_file('test.xz')
+        mtime = os.path.getmtime(self.path('test.xz'))
+        self.fetch_file('test.xz')
+
+        request = self.bucket.requests[-1]
+        self.assertEqual(FakeBucket.etag(self.CONTENTS), request.headers['If-None-Match'])
+        self.assertEqual(FakeBucket.LAST_MODIFIED, request.headers['If-Modified-Since'])
+        self.assertEqual(mtime, os.path.getmtime(self.path('test.xz')))
+
+    def test_fetch_file_refreshes_changed_file(self):
+        self.fetch_file('test.xz')
+        self.bucket.objects['test.xz'] = b'new contents'
+        self.fetch_file('test.xz')
+        self.assertEqual(b'new contents', self.read('test.xz'))
+        self.assertEqual(12, self.downloader.manifest.get('test.xz')['size'])
+
+    def test_fetch_file_refreshes_corrupted_file(self):
+        self.fetch_file('test.xz')
+        with open(self.path('test.xz'), 'wb') as fobj:
+            fobj.write(self.CONTENTS[:42])
+        self.fetch_file('test.xz')
+        self.assertNotIn('If-None-Match', self.bucket.requests[-1].headers)
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    def test_main_skips_size_of_files_checked_conditionally(self):
+        self.fetch_file('test.xz')
+        self.bucket.requests.clear()
+        self.loop.run_until_complete(self.downloader.main(('test.xz',)))
+        self.assertEqual(['GET'], [request.method for request in self.bucket.requests])
+
+    def download_in_parts(self, parts):
+        self.downloader.parts = parts
+        self.batch.sizes['test.xz'] = len(self.CONTENTS)
+        with patch('serenata_toolbox.datasets.downloader.MIN_PART_SIZE', 2 ** 16):
+            self.fetch_file('test.xz')
+
+    def test_fetch_file_in_parts(self):
+        self.download_in_parts(3)
+        ranges = sorted(request.headers['Range'] for request in self.bucket.requests)
+        expected = ['bytes=0-87395', 'bytes=174792-262185', 'bytes=87396-174791']
+        self.assertEqual(expected, ranges)
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS), sum(self.progress()))
+        self.assertTrue(self.downloader.manifest.is_intact('test.xz'))
+
+    def test_fetch_file_in_parts_no_more_than_min_part_size(self):
+        self.download_in_parts(42)
+        self.assertEqual(4, len(self.bucket.requests))
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    def test_fetch_file_in_parts_when_server_ignores_range(self):
+        self.bucket.ignore_range = True
+        self.download_in_parts(3)
+        self.assertEqual(1, len(self.bucket.requests))
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS), sum(self.progress()))
+
+    def test_fetch_file_verifies_published_checksum(self):
+        self.bucket.checksums['test.xz'] = sha256(self.CONTENTS).hexdigest()
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    def test_fetch_file_fails_on_checksum_mismatch(self):
+        self.bucket.checksums['test.xz'] = sha256(b'42').hexdigest()
+        with self.assertRaises(ChecksumMismatch) as context:
+            self.fetch_file('test.xz')
+
+        self.assertEqual(sha256(self.CONTENTS).hexdigest(), context.exception.actual)
+        self.assertEqual([], os.listdir(self.target))
+
+    def test_fetch_file_verifies_checksum_recorded_in_manifest(self):
+        self.fetch_file('test.xz')
+        entry = self.downloader.manifest.get('test.xz')
+        entry['sha256'] = sha256(b'42').hexdigest()
+        entry['size'] = 42  # forces a new download of the same ETag
+        with self.assertRaises(ChecksumMismatch):
+            self.fetch_file('test.xz')
+
+    def test_fetch_file_checksum_includes_resumed_bytes(self):
+        etag = FakeBucket.etag(self.CONTENTS)
+        self.bucket.checksums['test.xz'] = sha256(self.CONTENTS).hexdigest()
+        self.write_partial('test.xz', self.CONTENTS[:1000], etag)
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    def test_fetch_file_in_parts_verifies_published_checksum(self):
+        self.bucket.checksums['test.xz'] = sha256(b'42').hexdigest()
+        with self.assertRaises(ChecksumMismatch):
+            self.download_in_parts(3)
+        self.assertEqual([], os.listdir(self.target))
+
+    def test_main_with_preflight_sends_head_first(self):
+        self.loop.run_until_complete(self.downloader.main(('test.xz',)))
+        methods = [request.method for request in self.bucket.requests]
+        self.assertEqual(['HEAD', 'GET'], methods)
+
+    def test_main_with_loop_is_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            self.loop.run_until_complete(self.downloader.main(self.loop, ('test.xz',)))
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    @patch('serenata_toolbox.datasets.downloader.tqdm')
+    def test_main_without_preflight_grows_total(self, tqdm):
+        progress = tqdm.return_value.__enter__.return_value
+        progress.total = 0
+        self.bucket.objects['other.xz'] = b'42'
+        self.downloader.preflight = False
+        files = ('test.xz', 'other.xz')
+        self.loop.run_until_complete(self.downloader.main(files))
+
+        methods = [request.method for request in self.bucket.requests]
+        self.assertEqual(['GET', 'GET'], methods)
+        self.assertEqual(0, tqdm.call_args[1]['total'])
+        self.assertEqual(len(self.CONTENTS) + 2, progress.total)
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(b'42', self.read('other.xz'))
+
+    def test_download_async_within_running_loop(self):
+        self.bucket.objects['other.xz'] = b'42'
+
+        async def job():
+            return await asyncio.gather(
+                self.downloader.download_async('test.xz'),
+                Downloader(self.target).download_async('other.xz'),
+            )
+
+        with patch.object(Downloader, 'url', side_effect=self.bucket.url):
+            paths = self.loop.run_until_complete(job())
+
+        expected = [(self.path('test.xz'),), (self.path('other.xz'),)]
+        self.assertEqual(expected, paths)
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(b'42', self.read('other.xz'))
+
+    @patch('serenata_toolbox.datasets.downloader.tqdm')
+    def test_download_async_batches_of_the_same_downloader(self, tqdm):
+        progress = [MagicMock(), MagicMock()]
+        tqdm.return_value.__enter__.side_effect = progress
+        self.bucket.objects['other.xz'] = b'42'
+
+        async def job():
+            return await asyncio.gather(
+                self.downloader.download_async('test.xz'),
+                self.downloader.download_async('other.xz'),
+            )
+
+        paths = self.loop.run_until_complete(job())
+        expected = [(self.path('test.xz'),), (self.path('other.xz'),)]
+        self.assertEqual(expected, paths)
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertEqual(b'42', self.read('other.xz'))
+
+        totals = sorted(call[1]['total'] for call in tqdm.call_args_list)
+        self.assertEqual([2, len(self.CONTENTS)], totals)
+        received = sorted(sum(args[0] for args, _ in p.update.call_args_list) for p in progress)
+        self.assertEqual([2, len(self.CONTENTS)], received)
+
+    def test_download_async_reuses_client(self):
+        async def job():
+            async with ClientSession() as client:
+                await self.downloader.download_async('test.xz', client)
+                self.assertFalse(client.closed)
+
+        self.loop.run_until_complete(job())
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+
+class TestDownloaderRetries(HTTPTestCase):
+
+    CONTENTS = b'42' * 2 ** 10
+
+    def setUp(self):
+        super().setUp()
+        self.bucket.objects['other.xz'] = b'forty-two'
+        self.downloader.retries = 2
+        self.backoff = patch.object(Downloader, 'backoff', return_value=0)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+        super().tearDown()
+
+    def main(self, *files):
+        with patch('serenata_toolbox.datasets.downloader.tqdm') as tqdm:
+            self.loop.run_until_complete(self.downloader.main(files))
+        self.batch.progress = tqdm.return_value.__enter__.return_value  # for progress()
+
+    def requests(self, key):
+        return [r.method for r in self.bucket.requests if r.path.endswith(key)]
+
+    def test_retries_transient_errors(self):
+        self.bucket.failures['test.xz'] = [503, 500]
+        self.main('test.xz')
+        self.assertEqual(['HEAD', 'HEAD', 'HEAD', 'GET'], self.requests('test.xz'))
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+
+    def test_retries_interrupted_downloads_resuming_them(self):
+        self.bucket.objects['test.xz'] = self.CONTENTS * 2 ** 7
+        self.bucket.interrupt_after = 2 ** 17
+
+        def fix_server(attempt):
+            self.bucket.interrupt_after = None
+            return 0
+
+        with patch.object(Downloader, 'backoff', side_effect=fix_server):
+            self.main('test.xz')
+
+        self.assertEqual(self.CONTENTS * 2 ** 7, self.read('test.xz'))
+        self.assertEqual('bytes=131072-', self.bucket.requests[-1].headers['Range'])
+        self.assertEqual(len(self.CONTENTS) * 2 ** 7, sum(self.progress()))
+
+    @patch('serenata_toolbox.datasets.downloader.tqdm')
+    def test_retries_interrupted_downloads_without_preflight(self, tqdm):
+        progress = tqdm.return_value.__enter__.return_value
+        progress.total = 0
+        self.bucket.objects['test.xz'] = self.CONTENTS * 2 ** 7
+        self.bucket.interrupt_after = 2 ** 17
+        self.downloader.preflight = False
+
+        def fix_server(attempt):
+            self.bucket.interrupt_after = None
+            return 0
+
+        with patch.object(Downloader, 'backoff', side_effect=fix_server):
+            self.loop.run_until_complete(self.downloader.main(('test.xz',)))
+
+        self.assertEqual(self.CONTENTS * 2 ** 7, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS) * 2 ** 7, progress.total)
+
+    def test_retries_interrupted_downloads_of_changed_files(self):
+        self.bucket.objects['test.xz'] = self.CONTENTS * 2 ** 7
+        self.bucket.interrupt_after = 2 ** 17
+
+        def change_file(attempt):
+            self.bucket.interrupt_after = None
+            self.bucket.objects['test.xz'] = b'new contents'
+            return 0
+
+        with patch.object(Downloader, 'backoff', side_effect=change_file):
+            self.main('test.xz')
+
+        self.assertEqual(b'new contents', self.read('test.xz'))
+        self.assertEqual(len(b'new contents'), sum(self.progress()))
+
+    def test_retries_downloads_in_parts_once_every_range_stopped(self):
+        self.bucket.objects['test.xz'] = self.CONTENTS * 2 ** 7
+        self.bucket.range_failures['bytes=65536-131071'] = [500]
+        self.downloader.parts = 4
+        with patch('serenata_toolbox.datasets.downloader.MIN_PART_SIZE', 2 ** 16):
+            self.main('test.xz')
+
+        self.assertEqual(self.CONTENTS * 2 ** 7, self.read('test.xz'))
+        self.assertEqual(len(self.CONTENTS) * 2 ** 7, sum(self.progress()))
+
+    def test_raises_retries_exhausted_after_downloading_other_files(self):
+        self.bucket.failures['test.xz'] = [503] * 3
+        with self.assertRaises(RetriesExhausted) as context:
+            self.main('test.xz', 'other.xz')
+
+        self.assertEqual(3, context.exception.attempts)
+        self.assertIsInstance(context.exception.error, ServerError)
+        self.assertEqual(['HEAD'] * 3, self.requests('test.xz'))
+        self.assertEqual(b'forty-two', self.read('other.xz'))
+        self.assertFalse(os.path.exists(self.path('test.xz')))
+
+    def test_does_not_retry_missing_files(self):
+        with self.assertRaises(RemoteFileNotFound):
+            self.main('missing.xz', 'other.xz')
+        self.assertEqual(['HEAD'], self.requests('missing.xz'))
+        self.assertEqual(b'forty-two', self.read('other.xz'))
+
+    def test_backoff_is_capped_and_jittered(self):
+        self.backoff.stop()
+        with patch('serenata_toolbox.datasets.downloader.random.uniform') as uniform:
+            Downloader.backoff(1)
+            uniform.assert_called_with(0, settings.DOWNLOAD_BACKOFF_BASE)
+            Downloader.backoff(3)
+            uniform.assert_called_with(0, settings.DOWNLOAD_BACKOFF_BASE * 4)
+            Downloader.backoff(42)
+            uniform.assert_called_with(0, settings.DOWNLOAD_BACKOFF_MAX)
+        self.backoff.start()
+
+
+class TestDownloaderAsCompleted(HTTPTestCase):
+
+    CONTENTS = b'42' * 2 ** 10
+
+    def setUp(self):
+        super().setUp()
+        self.bucket.objects['small.xz'] = b'42'
+        self.bucket.objects['large.xz'] = b'42' * 2 ** 12
+        self.downloader.max_requests = 1  # completion order is the start order
+        self.downloader.retries = 0
+
+    def as_completed_async(self, files, order=None):
+        async def consume():
+            paths = []
+            async for path in self.downloader.as_completed_async(files, order):
+                self.assertTrue(os.path.exists(path))
+                paths.append(os.path.basename(path))
+            return paths
+
+        return self.loop.run_until_complete(consume())
+
+    def test_as_completed_async_keeps_order(self):
+        files = ('test.xz', 'large.xz', 'small.xz')
+        self.assertEqual(list(files), self.as_completed_async(files))
+
+    def test_as_completed_async_smallest_first(self):
+        files = ('test.xz', 'large.xz', 'small.xz')
+        expected = ['small.xz', 'test.xz', 'large.xz']
+        self.assertEqual(expected, self.as_completed_async(files, 'smallest'))
+
+    def test_as_completed_async_largest_first(self):
+        files = ('test.xz', 'large.xz', 'small.xz')
+        expected = ['large.xz', 'test.xz', 'small.xz']
+        self.assertEqual(expected, self.as_completed_async(files, 'largest'))
+
+    def test_as_completed_async_custom_order(self):
+        files = ('test.xz', 'large.xz', 'small.xz')
+        expected = ['large.xz', 'small.xz', 'test.xz']
+        self.assertEqual(expected, self.as_completed_async(files, str))
+
+    def test_as_completed_async_yields_before_raising_errors(self):
+        paths = []
+
+        async def consume():
+            async for path in self.downloader.as_completed_async(('missing.xz', 'small.xz')):
+                paths.append(os.path.basename(path))
+
+        with self.assertRaises(RemoteFileNotFound):
+            self.loop.run_until_complete(consume())
+        self.assertEqual(['small.xz'], paths)
+
+    def test_as_completed(self):
+        files = ('test.xz', 'large.xz', 'small.xz')
+
+        def consume():
+            return [os.path.basename(p) for p in self.downloader.as_completed(files, 'smallest')]
+
+        # the fake bucket needs its event loop running while we wait
+        paths = self.loop.run_until_complete(self.loop.run_in_executor(None, consume))
+        self.assertEqual(['small.xz', 'test.xz', 'large.xz'], paths)
+
+    def test_as_completed_raises_errors(self):
+        def consume():
+            return list(self.downloader.as_completed(('missing.xz',)))
+
+        with self.assertRaises(RemoteFileNotFound):
+            self.loop.run_until_complete(self.loop.run_in_executor(None, consume))
+
+
+class TestDownloaderMaterialize(HTTPTestCase):
+
+    DATA = pd.DataFrame({
+        'document_id': list(range(2 ** 13)),
+        'state': ['RJ', 'SP'] * 2 ** 12,
+        'net_value': [n / 100 for n in range(2 ** 13)],
+    })
+
+    def setUp(self):
+        with NamedTemporaryFile(suffix='.xz') as fobj:
+            self.DATA.to_csv(fobj.name, compression='xz', index=False)
+            self.CONTENTS = fobj.read()
+
+        super().setUp()
+        self.downloader.materialize = True
+        self.downloader.chunk_size = 2 ** 10
+
+    def assertMaterialized(self):
+        data = pd.read_feather(self.path('test.feather'))
+        pd.testing.assert_frame_equal(self.DATA, data, check_dtype=False)
+        self.assertIsNotNone(read_columnar(self.path('test.xz')))  # up to date
+
+    def test_materialize_while_streaming(self):
+        self.fetch_file('test.xz')
+        self.assertEqual(self.CONTENTS, self.read('test.xz'))
+        self.assertMaterialized()
+
+    def test_materialize_resumed_download(self):
+        etag = FakeBucket.etag(self.CONTENTS)
+        self.write_partial('test.xz', self.CONTENTS[:1000], etag)
+        self.fetch_file('test.xz')
+        self.assertMaterialized()
+
+    def test_materialize_download_in_parts(self):
+        self.downloader.parts = 2
+        self.batch.sizes['test.xz'] = len(self.CONTENTS)
+        with patch('serenata_toolbox.datasets.downloader.MIN_PART_SIZE', 2 ** 10):
+            self.fetch_file('test.xz')
+        self.assertMaterialized()
+
+    def test_materialize_nothing_when_checksum_mismatch(self):
+        self.bucket.checksums['test.xz'] = sha256(b'42').hexdigest()
+        with self.assertRaises(ChecksumMismatch):
+            self.fetch_file('test.xz')
+        self.assertEqual([], os.listdir(self.target))
+
+    @patch('serenata_toolbox.datasets.downloader.log')
+    @patch('serenata_toolbox.datasets.columnar.pa', None)
+    def test_materialize_without_pyarrow(self, log):
+        downloader = Downloader(self.target, materialize=True)
+        downloader.url = self.bucket.url
+        self.downloader = downloader
+        self.fetch_file('test.xz')
+        self.assertFalse(downloader.materialize)
+        self.assertEqual(1, log.warning.call_count)
+        self.assertEqual(['.manifest.json', 'test.xz'], sorted(os.listdir(self.target)))
+
+    def test_materialize_only_xz_files(self):
+        self.bucket.objects['test.csv'] = b'a,b\n1,2\n'
+        self.fetch_file('test.csv')
+        self.assertEqual(['.manifest.json', 'test.csv'], sorted(os.listdir(self.target)))
+
+
+class TestDownloaderSync(HTTPTestCase):
+
+    CONTENTS = b'42' * 2 ** 10
+
+    def setUp(self):
+        super().setUp()
+        self.bucket.objects['2018-01-05-companies.xz'] = b'companies'
+        self.bucket.objects['2018-01-05-reimbursements.xz'] = b'reimbursements'
+        self.bucket.page_size = 2
+
+    def sync(self, prefix=''):
+        return self.loop.run_until_complete(self.downloader.sync_async(prefix))
+
+    def test_list_bucket_pages_through_listing(self):
+        async def list_bucket():
+            async with ClientSession() as client:
+                return await self.downloader.list_bucket(client)
+
+        objects = self.loop.run_until_complete(list_bucket())
+        expected = sorted(self.bucket.objects)
+        self.assertEqual(expected, [obj.key for obj in objects])
+        self.assertEqual(len(self.CONTENTS), objects[-1].size)
+        self.assertEqual(FakeBucket.etag(self.CONTENTS), objects[-1].etag)
+        self.assertEqual(2, len(self.bucket.requests))
+
+    def test_sync_downloads_every_file(self):
+        paths = self.sync()
+        self.assertEqual(3, len(paths))
+        for filename, contents in self.bucket.objects.items():
+            self.assertEqual(contents, self.read(filename))
+
+    def test_sync_with_prefix(self):
+        paths = self.sync('2018-01-05-')
+        self.assertEqual(2, len(paths))
+        self.assertFalse(os.path.exists(self.path('test.xz')))
+
+    def test_sync_uses_listed_sizes_instead_of_head(self):
+        self.sync()
+        methods = [request.method for request in self.bucket.requests]
+        self.assertNotIn('HEAD', methods)
+
+    def test_sync_only_outdated_files(self):
+        self.sync()
+        self.bucket.objects['test.xz'] = b'new contents'
+        self.bucket.requests = []
+
+        paths = self.sync()
+        self.assertEqual((self.path('test.xz'),), paths)
+        self.assertEqual(b'new contents', self.read('test.xz'))
+        downloads = [r for r in self.bucket.requests if r.match_info['key']]
+        self.assertEqual(1, len(downloads))
+
+    def test_sync_nothing_to_download(self):
+        self.sync()
+        self.assertEqual((), self.sync())
+
+    def test_sync_files_not_in_manifest_compared_by_size(self):
+        with open(self.path('test.xz'), 'wb') as fobj:
+            fobj.write(self.CONTENTS)
+        with open(self.path('2018-01-05-companies.xz'), 'wb') as fobj:
+            fobj.write(b'older')
+
+        paths = self.sync()
+        self.assertNotIn(self.path('test.xz'), paths)
+        self.assertIn(self.path('2018-01-05-companies.xz'), paths)
+
+    def with_budget(self, **kwargs):
+        self.downloader.cache = CacheManager(
+            self.downloader.target, budget=1, manifest=self.downloader.manifest, **kwargs
+        )
+
+    def test_sync_skips_evicted_files(self):
+        self.bucket.objects['2017-01-05-companies.xz'] = b'older companies'
+        self.sync()
+        self.with_budget()
+        self.downloader.cache.evict()
+        self.assertFalse(os.path.exists(self.path('2017-01-05-companies.xz')))
+
+        self.bucket.requests = []
+        self.assertEqual((), self.sync())
+        self.assertFalse(os.path.exists(self.path('2017-01-05-companies.xz')))
+
+    def test_sync_skips_older_versions_with_a_budget(self):
+        self.bucket.objects['2017-01-05-companies.xz'] = b'older companies'
+        self.with_budget()
+        paths = self.sync()
+        self.assertEqual(3, len(paths))
+        self.assertNotIn(self.path('2017-01-05-companies.xz'), paths)
+
+    def test_sync_downloads_pinned_older_versions(self):
+        self.bucket.objects['2017-01-05-companies.xz'] = b'older companies'
+        self.with_budget(pinned=('companies',))
+        paths = self.sync()
+        self.assertIn(self.path('2017-01-05-companies.xz'), paths)
@@ -0,0 +1,22 @@
+from unittest import TestCase
+
+from serenata_toolbox.datasets.dtypes import PRESETS, preset, resolve
+
+
+class TestDtypes(TestCase):
+
+    def test_preset(self):
+        expected = PRESETS['reimbursements']
+        self.assertEqual(expected, preset('data/2018-01-05-reimbursements.xz'))
+        self.assertEqual(expected, preset('reimbursements-2017.csv'))
+        self.assertEqual({}, preset('2017-05-29-presences.xz'))
+
+    def test_preset_is_a_copy(self):
+        preset('2016-09-03-companies.xz')['cnpj'] = int
+        self.assertEqual(str, PRESETS['companies']['cnpj'])
+
+    def test_resolve(self):
+        self.assertEqual(PRESETS['companies'], resolve(None, '2016-09-03-companies.xz'))
+        self.assertEqual(PRESETS['companies'], resolve('companies', 'other.xz'))
+        self.assertEqual({'cnpj': str}, resolve({'cnpj': str}, '2016-09-03-companies.xz'))
+        self.assertEqual({}, resolve({}, '2016-09-03-companies.xz'))
@@ -0,0 +1,354 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import pandas as pd
+
+from serenata_toolbox.datasets.columnar import columnar_path
+from serenata_toolbox.datasets.dtypes import PRESETS
+from serenata_toolbox.datasets.loader import (
+    CHUNK_SIZE,
+    LazyDataset,
+    Memo,
+    chunks,
+    freeze,
+    newest,
+    newest_versions,
+    read,
+    select,
+    touch,
+)
+
+
+class TestNewest(TestCase):
+
+    FILES = (
+        '2016-12-15-speeches.xz',
+        '2017-05-29-presences.xz',
+        '2017-05-29-speeches.xz',
+        '2017-05-29-speeches.feather',
+        '2016-08-08-current-year.xz',
+    )
+
+    def test_newest(self):
+        self.assertEqual('2017-05-29-speeches.xz', newest('speeches', self.FILES))
+        self.assertEqual('2017-05-29-presences.xz', newest('presences', self.FILES))
+
+    def test_newest_matches_whole_name(self):
+        self.assertIsNone(newest('year', self.FILES))
+        self.assertIsNone(newest('companies', self.FILES))
+
+    def test_newest_without_date_stamp(self):
+        self.assertEqual('reimbursements-2017.csv',
+                         newest('reimbursements-2017', ('reimbursements-2017.csv',)))
+
+    def test_newest_versions(self):
+        expected = {
+            'speeches': '2017-05-29-speeches.xz',
+            'presences': '2017-05-29-presences.xz',
+            'current-year': '2016-08-08-current-year.xz',
+        }
+        self.assertEqual(expected, newest_versions(self.FILES))
+
+    @patch('serenata_toolbox.datasets.loader.parse_filename')
+    def test_newest_versions_parses_each_file_once(self, parse_filename):
+        parse_filename.side_effect = lambda filename: (filename[11:-3], filename[:10])
+        files = tuple('2017-05-{:02d}-dataset{}.xz'.format(day, n) for day in range(1, 29) for n in range(50))
+        self.assertEqual(50, len(newest_versions(files)))
+        self.assertEqual(len(files), parse_filename.call_count)
+
+
+class TestLazyDataset(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, '2017-05-29-presences.xz')
+        pd.DataFrame({'congressperson_id': ['42', '21'], 'presence': ['Present', 'Absent']}) \
+            .to_csv(self.path, compression='xz', encoding='utf-8', index=False)
+        self.resolve = Mock(return_value=self.path)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_read(self):
+        df = read(self.path, dtype={'congressperson_id': str})
+        self.assertEqual(['42', '21'], list(df.congressperson_id))
+
+    @patch('serenata_toolbox.datasets.loader.columnar')
+    def test_read_through_columnar_cache(self, columnar):
+        self.assertEqual(columnar.load.return_value, read(self.path))
+        columnar.load.assert_called_once_with(self.path, None, {})
+
+    @patch('serenata_toolbox.datasets.loader.columnar')
+    def test_read_without_cache(self, columnar):
+        read(self.path, cache=False)
+        read(self.path, sep=',')  # changes how the CSV is parsed
+        self.assertFalse(columnar.load.called)
+
+    def test_touch_records_access_keeping_version(self):
+        os.utime(self.path, (0, 42))
+        touch(self.path)
+        self.assertEqual(42, os.path.getmtime(self.path))
+        self.assertGreater(os.path.getatime(self.path), 42)
+
+    def test_nothing_happens_before_data_is_accessed(self):
+        dataset = LazyDataset('presences', self.resolve)
+        self.assertFalse(self.resolve.called)
+        self.assertFalse(dataset.is_loaded)
+        self.assertEqual('<LazyDataset presences (not loaded)>', repr(dataset))
+
+    def test_loads_on_first_access(self):
+        dataset = LazyDataset('presences', self.resolve, dtype={'congressperson_id': str})
+        self.assertEqual(2, len(dataset))
+        self.assertEqual(['42', '21'], list(dataset['congressperson_id']))
+        self.assertEqual((2, 2), dataset.shape)
+        self.assertEqual(['congressperson_id', 'presence'], list(dataset))
+        self.assertTrue(dataset.is_loaded)
+        self.resolve.assert_called_once_with()
+
+    def test_private_attributes_do_not_load(self):
+        dataset = LazyDataset('presences', self.resolve)
+        with self.assertRaises(AttributeError):
+            dataset.__deepcopy__
+        self.assertFalse(self.resolve.called)
+
+
+class TestMemo(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.paths = [os.path.join(self.directory, f'{n}.csv') for n in range(3)]
+        for n, path in enumerate(self.paths):
+            self.write(path, n)
+        self.memo = Memo(maxsize=2)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    @staticmethod
+    def write(path, value):
+        pd.DataFrame({'cnpj': ['42'], 'value': [value]}).to_csv(path, index=False)
+
+    def read(self, path, **kwargs):
+        with patch('serenata_toolbox.datasets.loader.read', wraps=read) as read_:
+            df = self.memo.read(path, **kwargs)
+        return df, read_.called
+
+    def test_freeze(self):
+        kwargs = {'usecols': ['a', 'b'], 'dtype': {'b': str, 'a': int}}
+        self.assertEqual(
+            (('dtype', (('a', int), ('b', str))), ('usecols', ('a', 'b'))),
+            freeze(kwargs),
+        )
+
+    def test_read_once(self):
+        first, parsed = self.read(self.paths[0])
+        self.assertTrue(parsed)
+        again, parsed = self.read(self.paths[0])
+        self.assertFalse(parsed)
+        pd.testing.assert_frame_equal(first, again)
+
+    def test_frames_are_shallow_copies(self):
+        first, _ = self.read(self.paths[0])
+        first['new'] = 1
+        again, _ = self.read(self.paths[0])
+        self.assertNotIn('new', again.columns)
+
+    def test_keyed_by_arguments(self):
+        self.read(self.paths[0])
+        df, parsed = self.read(self.paths[0], dtype={'cnpj': str})
+        self.assertTrue(parsed)
+        self.assertEqual('42', df.cnpj[0])
+        _, parsed = self.read(self.paths[0], dtype={'cnpj': str})
+        self.assertFalse(parsed)
+
+    def test_invalidated_when_file_changes(self):
+        self.read(self.paths[0])
+        self.write(self.paths[0], 42)
+        os.utime(self.paths[0], (0, 0))
+        df, parsed = self.read(self.paths[0])
+        self.assertTrue(parsed)
+        self.assertEqual(42, df.value[0])
+        self.assertEqual(1, len(self.memo))
+
+    def test_least_recently_used_is_dropped(self):
+        self.read(self.paths[0])
+        self.read(self.paths[1])
+        self.read(self.paths[0])
+        self.read(self.paths[2])
+        self.assertEqual(2, len(self.memo))
+        self.assertFalse(self.read(self.paths[0])[1])
+        self.assertTrue(self.read(self.paths[1])[1])
+
+    def test_disabled(self):
+        self.memo = Memo(maxsize=0)
+        self.read(self.paths[0])
+        self.assertTrue(self.read(self.paths[0])[1])
+        self.assertEqual(0, len(self.memo))
+
+    def test_unhashable_arguments_skip_memo(self):
+        _, parsed = self.read(self.paths[0], na_values=pd.Series(['-']))
+        self.assertTrue(parsed)
+        self.assertEqual(0, len(self.memo))
+
+    def test_clear(self):
+        self.read(self.paths[0])
+        self.memo.clear()
+        self.assertEqual(0, len(self.memo))
+
+
+class TestRead(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, 'reimbursements-2017.csv')
+        pd.DataFrame({
+            'document_id': [1, 2, 3, 4],
+            'cnpj_cpf': ['01234567000189', '98765432000110', None, '00000000000191'],
+            'state': ['SP', 'RJ', 'SP', 'MG'],
+            'year': [2017, 2017, 2016, None],
+            'total_net_value': [1.5, 2.5, 3.5, 4.5],
+        }).to_csv(self.path, index=False)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read(self, **kwargs):
+        """Reads the CSV file, then through the columnar copy, and compares."""
+        df = read(self.path, cache=False, **kwargs)
+        read(self.path)  # creates the columnar copy
+        self.assertTrue(os.path.exists(columnar_path(self.path)))
+        cached = read(self.path, **kwargs)
+        for frame in (df, cached):  # pyarrow has None for missing strings
+            frame.reset_index(drop=True, inplace=True)
+            for column in frame.select_dtypes(object):
+                frame[column] = frame[column].fillna('')
+        pd.testing.assert_frame_equal(df, cached)
+        return df
+
+    def test_preset(self):
+        df = self.read()
+        self.assertEqual('01234567000189', df.cnpj_cpf[0])
+        self.assertTrue(pd.isna(read(self.path).cnpj_cpf[2]))
+        self.assertEqual('category', df.state.dtype.name)
+        self.assertEqual('Int64', df.year.dtype.name)
+        self.assertEqual('Int64', df.document_id.dtype.name)
+
+    @patch('serenata_toolbox.datasets.columnar.feather', None)
+    @patch('serenata_toolbox.datasets.columnar.pa', None)
+    def test_without_pyarrow_reads_only_what_is_needed(self):
+        with patch('serenata_toolbox.datasets.loader.pd.read_csv', wraps=pd.read_csv) as read_csv:
+            df = read(self.path, columns=['state'], filters={'year': 2017})
+        self.assertEqual(['SP', 'RJ'], df.state.tolist())
+        _, kwargs = read_csv.call_args
+        self.assertEqual(['state', 'year'], kwargs['usecols'])
+        self.assertEqual(CHUNK_SIZE, kwargs['chunksize'])
+        self.assertFalse(os.path.exists(columnar_path(self.path)))
+
+    def test_without_preset(self):
+        df = self.read(dtype={})
+        self.assertEqual(1234567000189, df.cnpj_cpf[0])
+        self.assertEqual('object', df.state.dtype.name)
+
+    @patch('serenata_toolbox.datasets.loader.columnar')
+    def test_without_preset_does_not_use_columnar_copy(self, columnar):
+        read(self.path, dtype={'state': 'category'})
+        self.assertFalse(columnar.load.called)
+
+    def test_preset_plus_other_dtypes(self):
+        df = self.read(dtype={**PRESETS['reimbursements'], 'total_net_value': 'float32'})
+        self.assertEqual('float32', df.total_net_value.dtype.name)
+
+    def test_columns(self):
+        df = self.read(columns=['state', 'total_net_value'])
+        self.assertEqual(['state', 'total_net_value'], list(df.columns))
+        self.assertEqual('category', df.state.dtype.name)
+
+    def test_filters(self):
+        df = self.read(filters={'year': 2017, 'state': ['SP', 'MG']})
+        self.assertEqual([1], list(df.document_id))
+
+    def test_filters_on_columns_not_read(self):
+        df = self.read(columns=['document_id'], filters={'state': 'SP'})
+        self.assertEqual(['document_id'], list(df.columns))
+        self.assertEqual([1, 3], list(df.document_id))
+
+    def test_filters_in_chunks_keep_categories(self):
+        with patch('serenata_toolbox.datasets.loader.CHUNK_SIZE', 1):
+            df = read(self.path, cache=False, filters={'total_net_value': lambda v: v > 2})
+        self.assertEqual([2, 3, 4], list(df.document_id))
+        self.assertEqual('category', df.state.dtype.name)
+
+    def test_filters_matching_nothing(self):
+        with patch('serenata_toolbox.datasets.loader.CHUNK_SIZE', 1):
+            df = read(self.path, cache=False, filters={'state': 'AC'})
+        self.assertTrue(df.empty)
+
+    def test_select(self):
+        df = pd.DataFrame({'state': ['SP', 'RJ', 'MG'], 'value': [1, 2, 3]})
+        self.assertEqual(['SP'], list(select(df, {'state': 'SP'}).state))
+        self.assertEqual(['SP', 'MG'], list(select(df, {'state': {'SP', 'MG'}}).state))
+        self.assertEqual(['RJ'], list(select(df, {'value': lambda v: v % 2 == 0}).state))
+        self.assertEqual(3, len(select(df, {})))
+
+
+class TestChunks(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, '2018-01-05-reimbursements.xz')
+        self.data = pd.DataFrame({
+            'document_id': range(10),
+            'cnpj_cpf': ['0042'] * 10,
+            'state': ['SP', 'RJ'] * 5,
+            'total_net_value': [n / 2 for n in range(10)],
+        })
+        self.data.to_csv(self.path, compression='xz', index=False)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def chunks(self, cached, **kwargs):
+        if cached:
+            read(self.path)  # creates the columnar copy
+        with patch('serenata_toolbox.datasets.loader.pd.read_csv', wraps=pd.read_csv) as read_csv:
+            parsed = list(chunks(self.path, **kwargs))
+        self.assertEqual(not cached, read_csv.called)
+        return parsed
+
+    def test_chunks(self):
+        for cached in (False, True):
+            with self.subTest(cached=cached):
+                parsed = self.chunks(cached, chunksize=4)
+                self.assertEqual([4, 4, 2], [len(chunk) for chunk in parsed])
+                df = pd.concat(parsed, ignore_index=True)
+                self.assertEqual(list(range(10)), list(df.document_id))
+                self.assertEqual('0042', df.cnpj_cpf[9])
+                self.assertEqual('Int64', df.document_id.dtype.name)
+
+    def test_chunks_with_filters_and_columns(self):
+        for cached in (False, True):
+            with self.subTest(cached=cached):
+                parsed = self.chunks(
+                    cached,
+                    chunksize=4,
+                    columns=['document_id'],
+                    filters={'state': 'RJ', 'document_id': lambda ids: ids < 4},
+                )
+                self.assertEqual(1, len(parsed))  # empty chunks are skipped
+                self.assertEqual(['document_id'], list(parsed[0].columns))
+                self.assertEqual([1, 3], list(parsed[0].document_id))
+
+    def test_chunks_without_preset_parses_csv(self):
+        read(self.path)
+        with patch('serenata_toolbox.datasets.loader.pd.read_csv', wraps=pd.read_csv) as read_csv:
+            parsed = list(chunks(self.path, dtype={}))
+        self.assertTrue(read_csv.called)
+        self.assertEqual(42, parsed[0].cnpj_cpf[0])
+
+    def test_chunks_are_lazy(self):
+        parsed = chunks(os.path.join(self.directory, 'missing.csv'))
+        with self.assertRaises(FileNotFoundError):
+            next(parsed)
@@ -1,6 +1,6 @@
 import os
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, Mock, patch
 
 from serenata_toolbox.datasets.local import LocalDatasets
 
@@ -31,18 +31,54 @@ class TestLocal(TestCase):
         with self.assertRaises(FileNotFoundError):
             LocalDatasets('test')
 
-    @patch('serenata_toolbox.datasets.local.os.listdir')
-    @patch('serenata_toolbox.datasets.local.os.path.isfile')
+    @staticmethod
+    def entries(*files):
+        scan = MagicMock()
+        scan.__enter__.return_value = [
+            Mock(is_file=Mock(return_value=is_file)) for _, is_file in files
+        ]
+        for entry, (name, _) in zip(scan.__enter__.return_value, files):
+            entry.name = name
+        return scan
+
+    @patch('serenata_toolbox.datasets.local.os.scandir')
     @patch('serenata_toolbox.datasets.local.os.path.isdir')
     @patch('serenata_toolbox.datasets.local.os.path.exists')
-    def test_all(self, exists, isdir, isfile, listdir):
+    def test_all(self, exists, isdir, scandir):
         exists.return_value = True
         isdir.return_value = True
-        isfile.side_effect = (True, False, True)
-        listdir.return_value = ('0', '1', '2')
+        scandir.return_value = self.entries(('0', True), ('1', False), ('2', True))
         local = LocalDatasets('test')
         self.assertEqual(('0', '2'), tuple(local.all))
 
+    @patch('serenata_toolbox.datasets.local.os.scandir')
+    @patch('serenata_toolbox.datasets.local.os.path.isdir')
+    @patch('serenata_toolbox.datasets.local.os.path.exists')
+    def test_all_skips_bookkeeping_files(self, exists, isdir, scandir):
+        exists.return_value = True
+        isdir.return_value = True
+        files = (
+            '0.xz',
+            '0.feather',
+            '1.xz.part',
+            '1.xz.part.json',
+            '.manifest.json',
+            '.catalog.json.tmp',
+            '.catalog.json',
+        )
+        scandir.return_value = self.entries(*((name, True) for name in files))
+        local = LocalDatasets('test')
+        self.assertEqual(('0.xz',), tuple(local.all))
+
+    @patch('serenata_toolbox.datasets.local.Catalog')
+    @patch('serenata_toolbox.datasets.local.os.path.isdir')
+    @patch('serenata_toolbox.datasets.local.os.path.exists')
+    def test_describe(self, exists, isdir, catalog):
+        exists.return_value = True
+        isdir.return_value = True
+        local = LocalDatasets('test')
+        self.assertEqual(catalog.return_value.refresh.return_value, local.describe())
+        catalog.assert_called_once_with(os.path.abspath('test'))
 
     @patch('serenata_toolbox.datasets.contextmanager.print')
     @patch('serenata_toolbox.datasets.local.os.remove')
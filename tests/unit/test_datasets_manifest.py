@@ -0,0 +1,81 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from serenata_toolbox.datasets.manifest import Manifest
+
+
+class TestManifest(TestCase):
+
+    HEADERS = {
+        'ETag': '"42"',
+        'Last-Modified': 'Fri, 05 Jan 2018 00:00:00 GMT',
+    }
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.write('test.xz', b'42')
+        self.manifest = Manifest(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def write(self, filename, contents):
+        with open(os.path.join(self.directory, filename), 'wb') as fobj:
+            fobj.write(contents)
+
+    def test_load_without_manifest_file(self):
+        self.assertEqual({}, self.manifest.entries)
+
+    def test_update_persists_entry(self):
+        self.manifest.update('test.xz', self.HEADERS, '73475cb4')
+        expected = {
+            'etag': '"42"',
+            'last_modified': 'Fri, 05 Jan 2018 00:00:00 GMT',
+            'sha256': '73475cb4',
+            'size': 2,
+        }
+        self.assertEqual(expected, Manifest(self.directory).get('test.xz'))
+
+    def test_checksum(self):
+        self.manifest.update('test.xz', self.HEADERS, '73475cb4')
+        self.assertEqual('73475cb4', self.manifest.checksum('test.xz', '"42"'))
+
+    def test_checksum_for_another_etag(self):
+        self.manifest.update('test.xz', self.HEADERS, '73475cb4')
+        self.assertIsNone(self.manifest.checksum('test.xz', '"43"'))
+
+    def test_checksum_for_unknown_file(self):
+        self.assertIsNone(self.manifest.checksum('test.xz', '"42"'))
+
+    def test_is_intact(self):
+        self.manifest.update('test.xz', self.HEADERS)
+        self.assertTrue(self.manifest.is_intact('test.xz'))
+
+    def test_is_intact_for_unknown_file(self):
+        self.assertTrue(self.manifest.is_intact('test.xz'))
+
+    def test_is_intact_for_missing_file(self):
+        self.assertFalse(self.manifest.is_intact('missing.xz'))
+
+    def test_is_intact_for_corrupted_file(self):
+        self.manifest.update('test.xz', self.HEADERS)
+        self.write('test.xz', b'4')
+        self.assertFalse(self.manifest.is_intact('test.xz'))
+
+    def test_conditional_headers(self):
+        self.manifest.update('test.xz', self.HEADERS)
+        expected = {
+            'If-None-Match': '"42"',
+            'If-Modified-Since': 'Fri, 05 Jan 2018 00:00:00 GMT',
+        }
+        self.assertEqual(expected, self.manifest.conditional_headers('test.xz'))
+
+    def test_conditional_headers_for_unknown_file(self):
+        self.assertEqual({}, self.manifest.conditional_headers('test.xz'))
+
+    def test_conditional_headers_for_corrupted_file(self):
+        self.manifest.update('test.xz', self.HEADERS)
+        self.write('test.xz', b'4')
+        self.assertEqual({}, self.manifest.conditional_headers('test.xz'))
@@ -0,0 +1,253 @@
+import asyncio
+import os
+from datetime import datetime
+from hashlib import md5, sha256
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+from serenata_toolbox import settings
+from serenata_toolbox.datasets.downloader import Downloader
+from serenata_toolbox.datasets.remote import Signer
+from serenata_toolbox.datasets.uploader import MIN_PART_SIZE, UploadFailed, Uploader
+
+
+class FakeS3:
+    """Accepts signed uploads (simple or multipart) the way our bucket does."""
+
+    def __init__(self, loop, signer):
+        self.signer = signer
+        self.objects = {}
+        self.metadata = {}
+        self.uploads = {}
+        self.requests = []
+        self.failures = {}  # statuses returned before serving each method
+        self.delay = 0  # seconds taken to store each part
+
+        app = web.Application(client_max_size=2 ** 24)
+        app.router.add_route('*', '/{bucket}/{key:.*}', self.handle)
+        self.server = TestServer(app, loop=loop)
+        loop.run_until_complete(self.server.start_server())
+
+    def url(self, key):
+        return str(self.server.make_url(f'/{settings.AMAZON_BUCKET}/{key}'))
+
+    def is_signed(self, request, payload):
+        authorization = request.headers.get('Authorization', '')
+        names = authorization.partition('SignedHeaders=')[-1].partition(',')[0]
+        headers = {
+            name: request.headers[name] for name in names.split(';')
+            if name not in ('host', 'x-amz-content-sha256', 'x-amz-date')
+        }
+        now = datetime.strptime(request.headers['x-amz-date'], '%Y%m%dT%H%M%SZ')
+        url = f'http://{request.host}{request.raw_path}'
+        expected = self.signer.sign(request.method, url, headers, sha256(payload).hexdigest(), now)
+        return expected['Authorization'] == authorization
+
+    async def handle(self, request):
+        payload = await request.read()
+        self.requests.append((request.method, request.query_string))
+        if not self.is_signed(request, payload):
+            return web.Response(status=403)
+
+        if self.failures.get(request.method):
+            return web.Response(status=self.failures[request.method].pop(0))
+
+        key, query = request.match_info['key'], request.query
+        if request.method == 'HEAD':
+            if key not in self.objects:
+                return web.Response(status=404)
+            return web.Response(headers=self.metadata[key])
+
+        if request.method == 'POST' and 'uploads' in query:
+            upload_id = str(len(self.uploads) + 1)
+            self.uploads[upload_id] = {'key': key, 'parts': {}, 'headers': self.meta(request)}
+            body = (f'<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                    f'<Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                    f'</InitiateMultipartUploadResult>')
+            return web.Response(body=body.encode(), content_type='application/xml')
+
+        if request.method == 'PUT' and 'uploadId' in query:
+            await asyncio.sleep(self.delay)
+            upload = self.uploads.get(query['uploadId'])
+            if upload is None:  # NoSuchUpload
+                return web.Response(status=404)
+            upload['parts'][int(query['partNumber'])] = payload
+            return web.Response(headers={'ETag': f'"{md5(payload).hexdigest()}"'})
+
+        if request.method == 'POST' and 'uploadId' in query:
+            upload = self.uploads.pop(query['uploadId'])
+            parts = upload['parts']
+            self.store(key, b''.join(parts[n] for n in sorted(parts)), upload['headers'])
+            return web.Response(body=b'<CompleteMultipartUploadResult/>')
+
+        if request.method == 'DELETE' and 'uploadId' in query:
+            self.uploads.pop(query['uploadId'], None)
+            return web.Response(status=204)
+
+        if request.method == 'PUT':
+            self.store(key, payload, self.meta(request))
+            return web.Response(headers={'ETag': f'"{md5(payload).hexdigest()}"'})
+
+        return web.Response(status=405)
+
+    @staticmethod
+    def meta(request):
+        return {k: v for k, v in request.headers.items() if k.lower().startswith('x-amz-meta-')}
+
+    def store(self, key, contents, headers):
+        self.objects[key] = contents
+        self.metadata[key] = headers
+
+
+class TestUploader(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.source = mkdtemp()
+        self.bucket = FakeS3(self.loop, Signer('key', 'secret', settings.AMAZON_REGION))
+        self.uploader = Uploader(self.source, retries=1)
+        self.uploader.signer = self.bucket.signer
+        self.uploader.progress = MagicMock()
+        self.object_url = patch('serenata_toolbox.datasets.uploader.object_url', self.bucket.url)
+        self.object_url.start()
+
+    def tearDown(self):
+        self.object_url.stop()
+        self.loop.run_until_complete(self.bucket.server.close())
+        self.loop.close()
+        rmtree(self.source)
+
+    def write(self, filename, contents):
+        with open(os.path.join(self.source, filename), 'wb') as fobj:
+            fobj.write(contents)
+
+    def upload(self, files):
+        return self.loop.run_until_complete(self.uploader.upload_async(files))
+
+    def test_init_no_existing_source(self):
+        with self.assertRaises(FileNotFoundError):
+            Uploader(os.path.join(self.source, 'missing'))
+
+    def test_init_part_size_is_at_least_the_minimum(self):
+        self.assertEqual(MIN_PART_SIZE, Uploader(self.source, part_size=42).part_size)
+
+    def test_upload_file(self):
+        self.write('test.xz', b'42')
+        self.assertEqual(('test.xz',), self.upload('test.xz'))
+        self.assertEqual(b'42', self.bucket.objects['test.xz'])
+        expected = {
+            'x-amz-meta-sha256': sha256(b'42').hexdigest(),
+        }
+        self.assertEqual(expected, {k.lower(): v for k, v in self.bucket.metadata['test.xz'].items()})
+
+    def test_upload_in_parts(self):
+        contents = os.urandom(2 * MIN_PART_SIZE + 42)
+        self.write('test.xz', contents)
+        self.uploader.part_size = MIN_PART_SIZE
+        self.upload('test.xz')
+
+        self.assertEqual(contents, self.bucket.objects['test.xz'])
+        self.assertEqual({}, self.bucket.uploads)
+        parts = [query for method, query in self.bucket.requests if 'partNumber' in query]
+        self.assertEqual(3, len(parts))
+
+    def test_upload_skips_unchanged_files(self):
+        self.write('test.xz', b'42')
+        self.write('other.xz', b'42')
+        self.upload('test.xz')
+
+        self.bucket.requests = []
+        self.assertEqual(('other.xz',), self.upload(('test.xz', 'other.xz')))
+        methods = sorted(method for method, _ in self.bucket.requests)
+        self.assertEqual(['HEAD', 'HEAD', 'PUT'], methods)
+
+    def test_upload_changed_files(self):
+        self.write('test.xz', b'42')
+        self.upload('test.xz')
+        self.write('test.xz', b'forty-two')
+        self.assertEqual(('test.xz',), self.upload('test.xz'))
+        self.assertEqual(b'forty-two', self.bucket.objects['test.xz'])
+
+    @patch.object(Downloader, 'backoff', return_value=0)
+    def test_upload_retries_transient_errors(self, backoff):
+        self.write('test.xz', b'42')
+        self.bucket.failures = {'PUT': [503]}
+        self.upload('test.xz')
+        self.assertEqual(b'42', self.bucket.objects['test.xz'])
+
+    @patch.object(Downloader, 'backoff', return_value=0)
+    def test_upload_aborts_failed_multipart_uploads(self, backoff):
+        self.write('test.xz', os.urandom(MIN_PART_SIZE + 42))
+        self.uploader.part_size = MIN_PART_SIZE
+        self.uploader.retries = 0
+        self.uploader.max_requests = 1
+        self.bucket.failures = {'PUT': [503]}  # the first part
+        with self.assertRaises(UploadFailed):
+            self.upload('test.xz')
+
+        self.assertEqual({}, self.bucket.uploads)
+        self.assertIn('DELETE', [method for method, _ in self.bucket.requests])
+        self.assertNotIn('test.xz', self.bucket.objects)
+
+    @patch.object(Downloader, 'backoff', return_value=0)
+    def test_upload_aborts_after_the_other_parts_are_cancelled(self, backoff):
+        self.write('test.xz', os.urandom(3 * MIN_PART_SIZE + 42))
+        self.uploader.part_size = MIN_PART_SIZE
+        self.uploader.retries = 0
+        self.uploader.max_requests = 4
+        self.bucket.failures = {'PUT': [503]}
+        self.bucket.delay = 0.2  # the other parts are still being sent
+        in_flight, events = set(), []
+        request = self.uploader.request
+
+        async def tracked(client, method, filename, query='', **kwargs):
+            events.append((method, set(in_flight)))
+            in_flight.add(query)
+            try:
+                return await request(client, method, filename, query, **kwargs)
+            finally:
+                in_flight.discard(query)
+
+        async def upload():
+            async with ClientSession() as client:  # still open after the failure
+                with self.assertRaises(UploadFailed):
+                    await self.uploader.upload_async('test.xz', client)
+
+        with patch.object(self.uploader, 'request', tracked):
+            self.loop.run_until_complete(upload())
+
+        self.assertEqual({}, self.bucket.uploads)
+        methods = [method for method, _ in events]
+        self.assertEqual('DELETE', methods[-1])
+        self.assertEqual(set(), events[-1][1])  # no part was still being sent
+
+    @patch.object(Downloader, 'backoff', return_value=0)
+    def test_upload_retries_failed_parts_only(self, backoff):
+        contents = os.urandom(2 * MIN_PART_SIZE + 42)
+        self.write('test.xz', contents)
+        self.uploader.part_size = MIN_PART_SIZE
+        self.uploader.max_requests = 1
+        self.bucket.failures = {'PUT': [503]}  # the first part
+        self.upload('test.xz')
+
+        self.assertEqual(contents, self.bucket.objects['test.xz'])
+        methods = [method for method, _ in self.bucket.requests]
+        self.assertEqual(['HEAD', 'POST', 'PUT', 'PUT', 'PUT', 'PUT', 'POST'], methods)
+
+    def test_upload_reuses_client(self):
+        self.write('test.xz', b'42')
+
+        async def upload():
+            async with ClientSession() as client:
+                await self.uploader.upload_async('test.xz', client)
+                return client.closed
+
+        self.assertFalse(self.loop.run_until_complete(upload()))
+        self.assertEqual(b'42', self.bucket.objects['test.xz'])
+
+    def test_upload_no_file(self):
+        self.assertIsNone(self.upload([]))